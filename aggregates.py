@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+from database import read_only
+from schemas import OrderStatus
+
+UPSERT_DIALECTS = {
+    "mysql": mysql.insert,
+    "mariadb": mysql.insert,
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+class SalesDelta:
+    """Counter changes collected by a service call and written in one go."""
+
+    def __init__(self):
+        self.orders = defaultdict(int)
+        self.units = defaultdict(int)
+        self.revenue = defaultdict(int)
+
+    def order(self, status: OrderStatus, count: int = 1):
+        self.orders[OrderStatus(status)] += count
+
+    def sale(self, product_id: int, quantity: int, price: int, sign: int = 1):
+        self.units[product_id] += sign * quantity
+        self.revenue[product_id] += sign * quantity * price
+
+    def apply(self, db: Session):
+        """Add the collected changes to the counter tables; runs in the caller's transaction."""
+        _increment(db, models.OrderStatusCount, "status", {
+            status: {"orders": count} for status, count in self.orders.items() if count
+        })
+        _increment(db, models.ProductSales, "product_id", {
+            product_id: {"units": self.units[product_id], "revenue": self.revenue[product_id]}
+            for product_id in self.units if self.units[product_id] or self.revenue[product_id]
+        })
+
+
+def _increment(db: Session, model, key: str, changes: dict):
+    """``INSERT ... ON DUPLICATE KEY UPDATE col = col + new`` for every row in ``changes``.
+
+    Rows are written in key order so concurrent writers lock them in the same order.
+    """
+    if not changes:
+        return
+    rows = [{key: row_key, **values} for row_key, values in sorted(changes.items())]
+    columns = list(rows[0].keys() - {key})
+    statement = UPSERT_DIALECTS[db.get_bind().dialect.name](model).values(rows)
+    if hasattr(statement, "on_duplicate_key_update"):
+        statement = statement.on_duplicate_key_update(
+            {column: getattr(model, column) + statement.inserted[column] for column in columns})
+    else:
+        statement = statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={column: getattr(model, column) + statement.excluded[column] for column in columns})
+    db.execute(statement)
+
+
+def order_counts(db: Session) -> dict[str, int]:
+    counts = dict(db.execute(select(models.OrderStatusCount.status, models.OrderStatusCount.orders)).all())
+    return {status.value: counts.get(status, 0) for status in OrderStatus}
+
+
+def product_sales(db: Session, product_id: int) -> dict:
+    row = db.get(models.ProductSales, product_id)
+    return {
+        "product_id": product_id,
+        "units": row.units if row is not None else 0,
+        "revenue": row.revenue if row is not None else 0,
+    }
+
+
+def top_products(db: Session, limit: int = 10) -> list[dict]:
+    """Best selling products by revenue, read from the ``revenue`` index."""
+    rows = db.execute(
+        select(models.ProductSales.product_id, models.ProductSales.units, models.ProductSales.revenue)
+        .order_by(models.ProductSales.revenue.desc())
+        .limit(limit)
+    )
+    return [row._asdict() for row in rows]
+
+
+@read_only
+def get_stats(db: Session, top: int = 10) -> dict:
+    return {"orders_by_status": order_counts(db), "top_products": top_products(db, top)}
+
+
+def rebuild(db: Session):
+    """Recompute every counter from ``order`` and ``orderitem``.
+
+    Used to backfill the tables and to repair them after out-of-band changes.
+    Cancelled orders count towards their status but not towards sales, and
+    revenue uses the unit price stored on each item.
+    """
+    db.execute(delete(models.OrderStatusCount))
+    db.execute(delete(models.ProductSales))
+    db.execute(insert(models.OrderStatusCount).from_select(
+        ["status", "orders"],
+        select(models.Order.status, func.count()).group_by(models.Order.status),
+    ))
+    db.execute(insert(models.ProductSales).from_select(
+        ["product_id", "units", "revenue"],
+        select(
+            models.OrderItem.product_id,
+            func.sum(models.OrderItem.quantity),
+            func.coalesce(func.sum(models.OrderItem.quantity * models.OrderItem.price), 0),
+        )
+        .join(models.Order, models.Order.id == models.OrderItem.order_id)
+        .join(models.Product, models.Product.id == models.OrderItem.product_id)
+        .where(models.Order.status != OrderStatus.CANCELLED)
+        .group_by(models.OrderItem.product_id),
+    ))
+    db.commit()
@@ -0,0 +1,29 @@
+"""Unit price on order items
+
+Revision ID: 3f6a2d8b5e17
+Revises: 7e2b9c4d1f58
+Create Date: 2026-10-18 19:41:05.208317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6a2d8b5e17'
+down_revision = '7e2b9c4d1f58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('orderitem', sa.Column('price', sa.Integer(), nullable=True))
+    # Existing items get the current price, the best record of what they sold for.
+    op.execute(
+        "UPDATE orderitem SET price = "
+        "(SELECT product.price FROM product WHERE product.id = orderitem.product_id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('orderitem', 'price')
@@ -0,0 +1,29 @@
+"""Order listing indexes
+
+Revision ID: 4b1f7c2e9a30
+Revises: cdd037cdcb66
+Create Date: 2026-10-18 09:12:41.503128
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1f7c2e9a30'
+down_revision = 'cdd037cdcb66'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_order_status_id', 'order', ['status', 'id'], unique=False)
+    op.create_index('ix_order_address_id_id', 'order', ['address_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    # MySQL dropped its implicit foreign key index on address_id in favour of
+    # the composite one, so restore it before the composite goes away.
+    op.create_index('address_id', 'order', ['address_id'], unique=False)
+    op.drop_index('ix_order_address_id_id', table_name='order')
+    op.drop_index('ix_order_status_id', table_name='order')
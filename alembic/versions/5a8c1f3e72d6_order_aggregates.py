@@ -0,0 +1,52 @@
+"""Order and sales counters
+
+Revision ID: 5a8c1f3e72d6
+Revises: e27c40b9d15a
+Create Date: 2026-10-18 15:20:44.310925
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8c1f3e72d6'
+down_revision = 'e27c40b9d15a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('order_status_count',
+    sa.Column('status', sa.Enum('pending', 'completed', 'cancelled', name='order_status'), nullable=False),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('status')
+    )
+    op.create_table('product_sales',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('units', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index(op.f('ix_product_sales_revenue'), 'product_sales', ['revenue'], unique=False)
+
+    op.execute(
+        "INSERT INTO order_status_count (status, orders) "
+        "SELECT status, COUNT(*) FROM `order` GROUP BY status"
+    )
+    op.execute(
+        "INSERT INTO product_sales (product_id, units, revenue) "
+        "SELECT orderitem.product_id, SUM(orderitem.quantity), SUM(orderitem.quantity * product.price) "
+        "FROM orderitem "
+        "JOIN `order` ON `order`.id = orderitem.order_id "
+        "JOIN product ON product.id = orderitem.product_id "
+        "WHERE `order`.status != 'cancelled' "
+        "GROUP BY orderitem.product_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_product_sales_revenue'), table_name='product_sales')
+    op.drop_table('product_sales')
+    op.drop_table('order_status_count')
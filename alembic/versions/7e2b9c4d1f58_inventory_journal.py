@@ -0,0 +1,29 @@
+"""Inventory journal for hot product flushes
+
+Revision ID: 7e2b9c4d1f58
+Revises: c61f0d8a4e27
+Create Date: 2026-10-18 17:12:37.519804
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2b9c4d1f58'
+down_revision = 'c61f0d8a4e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('inventory_journal',
+    sa.Column('batch_id', sa.String(length=32), nullable=False),
+    sa.Column('products', sa.Integer(), nullable=False),
+    sa.Column('applied_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('batch_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('inventory_journal')
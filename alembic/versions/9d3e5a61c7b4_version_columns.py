@@ -0,0 +1,26 @@
+"""Version columns for optimistic locking
+
+Revision ID: 9d3e5a61c7b4
+Revises: 4b1f7c2e9a30
+Create Date: 2026-10-18 11:03:27.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3e5a61c7b4'
+down_revision = '4b1f7c2e9a30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('product', sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('order', sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('order', 'version_id')
+    op.drop_column('product', 'version_id')
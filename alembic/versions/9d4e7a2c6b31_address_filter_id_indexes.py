@@ -0,0 +1,28 @@
+"""Address filter indexes ending in id
+
+Revision ID: 9d4e7a2c6b31
+Revises: 3f6a2d8b5e17
+Create Date: 2026-10-18 21:12:47.530184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4e7a2c6b31'
+down_revision = '3f6a2d8b5e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_address_country_id', 'address', ['country', 'id'], unique=False)
+    op.create_index('ix_address_country_city_id', 'address', ['country', 'city', 'id'], unique=False)
+    op.create_index('ix_address_city_id', 'address', ['city', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_address_city_id', table_name='address')
+    op.drop_index('ix_address_country_city_id', table_name='address')
+    op.drop_index('ix_address_country_id', table_name='address')
@@ -0,0 +1,28 @@
+"""Address filter indexes
+
+Revision ID: c61f0d8a4e27
+Revises: 5a8c1f3e72d6
+Create Date: 2026-10-18 16:05:12.842611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c61f0d8a4e27'
+down_revision = '5a8c1f3e72d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_address_country_city_street', 'address', ['country', 'city', 'street'], unique=False)
+    op.create_index('ix_address_city_street', 'address', ['city', 'street'], unique=False)
+    op.create_index('ix_address_street', 'address', ['street'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_address_street', table_name='address')
+    op.drop_index('ix_address_city_street', table_name='address')
+    op.drop_index('ix_address_country_city_street', table_name='address')
@@ -0,0 +1,32 @@
+"""Order status as an enum
+
+Revision ID: e27c40b9d15a
+Revises: 9d3e5a61c7b4
+Create Date: 2026-10-18 13:42:09.551270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e27c40b9d15a'
+down_revision = '9d3e5a61c7b4'
+branch_labels = None
+depends_on = None
+
+order_status = sa.Enum('pending', 'completed', 'cancelled', name='order_status')
+
+
+def upgrade() -> None:
+    op.alter_column('order', 'status',
+               existing_type=sa.String(length=50),
+               type_=order_status,
+               existing_nullable=False)
+
+
+def downgrade() -> None:
+    op.alter_column('order', 'status',
+               existing_type=order_status,
+               type_=sa.String(length=50),
+               existing_nullable=False)
@@ -0,0 +1,254 @@
+"""ASGI entry point: async read endpoints in front of the Flask app.
+
+Run with ``uvicorn asgi:app``. GET requests for products, addresses and
+orders are served by async handlers on the async engine. Every other
+request is passed through to the WSGI Flask app. Products and addresses
+carry the same ETag and Last-Modified validators as the Flask routes.
+
+Single products and addresses are read through the same local and Redis
+caches as the Flask routes, on a worker thread, so cache hits never reach
+the database. Every route reports Server-Timing and request metrics.
+"""
+from functools import wraps
+
+import redis
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import async_services
+import http_cache
+import instrumentation
+import serializers
+import services
+from app import (
+    DEFAULT_PAGE_SIZE, MAX_MULTI_GET_IDS, MAX_PAGE_SIZE, STREAM_CHUNK_SIZE, app as flask_app, multi_get_result,
+    parse_ids,
+)
+from cache import versions
+from database import AsyncSessionLocal, SessionLocal, get_async_engine
+
+
+class JSONBytesResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return flask_app.json.dumps(content).encode()
+
+
+def _int_arg(request, name):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _as_bool(value) -> bool:
+    return value is not None and value.lower() in ("1", "true", "yes")
+
+
+def _ids_error(ids):
+    if not ids:
+        return JSONBytesResponse({"error": "'ids' must be a comma separated list of integers"}, status_code=400)
+    if len(ids) > MAX_MULTI_GET_IDS:
+        return JSONBytesResponse({"error": f"At most {MAX_MULTI_GET_IDS} ids per request"}, status_code=400)
+    return None
+
+
+def conditional(table: str, row_param=None):
+    """Async counterpart of ``http_cache.conditional``, without the shared response cache."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            row_id = request.path_params.get(row_param) if row_param else None
+            try:
+                version = await run_in_threadpool(versions.get, table, row_id)
+            except redis.RedisError as e:
+                print(f"Version store unavailable, serving {request.url.path} without validators: {e}")
+                version = None
+            if version is None:
+                return await handler(request)
+
+            etag, modified_at = version
+            headers = http_cache.validator_headers(etag, modified_at)
+            if http_cache.not_modified(etag, modified_at, request.headers):
+                return Response(status_code=304, headers=headers)
+            response = await handler(request)
+            if response.status_code == 200:
+                response.headers.update(headers)
+            return response
+
+        return wrapper
+    return decorator
+
+
+@conditional("product")
+async def get_products(request):
+    if "ids" in request.query_params:
+        ids = parse_ids(request.query_params["ids"])
+        error = _ids_error(ids)
+        if error:
+            return error
+        async with AsyncSessionLocal() as db:
+            return JSONBytesResponse(multi_get_result(ids, await async_services.get_products_by_ids(db, ids)))
+
+    limit = _int_arg(request, "limit")
+    after = _int_arg(request, "after")
+
+    if limit is None and after is None:
+        return StreamingResponse(_stream_products(), media_type="application/json")
+
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    if limit < 1:
+        return JSONBytesResponse({"error": "'limit' must be positive"}, status_code=400)
+
+    async with AsyncSessionLocal() as db:
+        products = await async_services.get_products_page(db, limit, after)
+
+    headers = {"X-Next-After": str(products[-1]["id"])} if len(products) == limit else None
+    return JSONBytesResponse(products, headers=headers)
+
+
+async def _stream_products():
+    async with AsyncSessionLocal() as db:
+        yield b"["
+        index = 0
+        async for page in async_services.iter_product_pages(db, STREAM_CHUNK_SIZE):
+            yield (b"," if index else b"") + serializers.product.many_json(page)[1:-1]
+            index += 1
+        yield b"]"
+
+
+def _cached(getter, object_id):
+    with SessionLocal() as db:
+        return getter(db, object_id)
+
+
+async def get_product_by_id(request):
+    product_dict = await run_in_threadpool(_cached, services.get_cached_product, request.path_params["product_id"])
+    if product_dict is None:
+        return JSONBytesResponse({"error": "Object not found"}, status_code=404)
+    etag = str(product_dict["version_id"])
+    headers = http_cache.validator_headers(etag)
+    if http_cache.not_modified(etag, headers=request.headers):
+        return Response(status_code=304, headers=headers)
+    return JSONBytesResponse({key: value for key, value in product_dict.items() if key != "version_id"},
+                             headers=headers)
+
+
+async def get_addresses(request):
+    if "ids" in request.query_params:
+        ids = parse_ids(request.query_params["ids"])
+        error = _ids_error(ids)
+        if error:
+            return error
+        async with AsyncSessionLocal() as db:
+            return JSONBytesResponse(multi_get_result(ids, await async_services.get_addresses_by_ids(db, ids)))
+
+    limit = min(_int_arg(request, "limit") or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    if limit < 1:
+        return JSONBytesResponse({"error": "'limit' must be positive"}, status_code=400)
+
+    async with AsyncSessionLocal() as db:
+        addresses = await async_services.search_addresses(
+            db,
+            street=request.query_params.get("street"),
+            city=request.query_params.get("city"),
+            country=request.query_params.get("country"),
+            limit=limit,
+            after=_int_arg(request, "after"),
+        )
+    headers = {"X-Next-After": str(addresses[-1]["id"])} if len(addresses) == limit else None
+    return JSONBytesResponse(serializers.address.many(addresses), headers=headers)
+
+
+@conditional("address", "address_id")
+async def get_address_by_id(request):
+    address = await run_in_threadpool(_cached, services.get_cached_address, request.path_params["address_id"])
+    if address is None:
+        return JSONBytesResponse({"error": "Object not found"}, status_code=404)
+    return JSONBytesResponse(address)
+
+
+async def get_orders(request):
+    limit = min(_int_arg(request, "limit") or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    if limit < 1:
+        return JSONBytesResponse({"error": "'limit' must be positive"}, status_code=400)
+
+    sort = request.query_params.get("sort", "id")
+    if sort not in ("id", "-id"):
+        return JSONBytesResponse({"error": "'sort' must be 'id' or '-id'"}, status_code=400)
+
+    async with AsyncSessionLocal() as db:
+        orders = await async_services.get_orders(
+            db,
+            status=request.query_params.get("status"),
+            address_id=_int_arg(request, "address_id"),
+            min_id=_int_arg(request, "min_id"),
+            max_id=_int_arg(request, "max_id"),
+            after=_int_arg(request, "after"),
+            limit=limit,
+            descending=sort == "-id",
+        )
+        headers = {"X-Next-After": str(orders[-1].id)} if len(orders) == limit else None
+        return JSONBytesResponse(serializers.order.many(orders), headers=headers)
+
+
+async def get_order_by_id(request):
+    compact = _as_bool(request.query_params.get("compact"))
+    async with AsyncSessionLocal() as db:
+        order = await async_services.get_order_by_id(
+            db, request.path_params["order_id"], with_items=not compact, with_address=True)
+        if order is None:
+            return JSONBytesResponse({"error": "Object not found"}, status_code=404)
+        serializer = serializers.order_detail_compact if compact else serializers.order_detail
+        return JSONBytesResponse(serializer.one(order))
+
+
+async def get_order_status(request):
+    async with AsyncSessionLocal() as db:
+        status = await async_services.get_order_status_by_id(db, request.path_params["order_id"])
+    if status is None:
+        return JSONBytesResponse({"error": "Order not found"}, status_code=404)
+    return JSONBytesResponse({"status": status})
+
+
+async def get_orders_by_status(request):
+    status = request.query_params.get("status")
+    if not status:
+        return JSONBytesResponse({"error": "Missing 'status' query parameter"}, status_code=400)
+
+    compact = _as_bool(request.query_params.get("compact"))
+    async with AsyncSessionLocal() as db:
+        orders = await async_services.get_order_by_status(db, status, with_items=not compact)
+        serializer = serializers.order_summary if compact else serializers.order
+        return JSONBytesResponse(serializer.many(orders))
+
+
+async def dispose_async_engine():
+    await get_async_engine().dispose()
+
+
+def _route(path, view):
+    return Route(path, instrumentation.instrument_async_view(view), methods=["GET"])
+
+
+instrumentation.instrument_engine(get_async_engine().sync_engine)
+
+app = Starlette(
+    routes=[
+        _route("/products/", get_products),
+        _route("/products/{product_id:int}/", get_product_by_id),
+        _route("/addresses/", get_addresses),
+        _route("/addresses/{address_id:int}/", get_address_by_id),
+        _route("/orders/", get_orders),
+        _route("/orders/status/", get_orders_by_status),
+        _route("/orders/{order_id:int}/", get_order_by_id),
+        _route("/orders/{order_id:int}/status/", get_order_status),
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ],
+    on_shutdown=[dispose_async_engine],
+)
@@ -0,0 +1,72 @@
+"""Async counterparts of the read-only queries in ``services``.
+
+They execute the same select statements on an ``AsyncSession``.
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+
+import models
+import services
+
+
+async def get_products_page(db: AsyncSession, limit: int, after: Optional[int] = None) -> list[dict]:
+    result = await db.execute(services.products_page_query(limit, after))
+    return [row._asdict() for row in result]
+
+
+async def iter_product_pages(db: AsyncSession, chunk_size: int = 1000):
+    after = None
+    while True:
+        page = await get_products_page(db, chunk_size, after)
+        if page:
+            yield page
+        if len(page) < chunk_size:
+            return
+        after = page[-1]["id"]
+
+
+async def get_products_by_ids(db: AsyncSession, ids) -> dict[int, dict]:
+    found = {}
+    for chunk in services.id_chunks(ids):
+        for row in await db.execute(services.products_by_ids_query(chunk)):
+            found[row.id] = row._asdict()
+    return found
+
+
+async def get_addresses_by_ids(db: AsyncSession, ids) -> dict[int, dict]:
+    found = {}
+    for chunk in services.id_chunks(ids):
+        for row in await db.execute(services.addresses_by_ids_query(chunk)):
+            found[row.id] = row._asdict()
+    return found
+
+
+async def search_addresses(
+        db: AsyncSession,
+        street: Optional[str] = None,
+        city: Optional[str] = None,
+        country: Optional[str] = None,
+        limit: int = 100,
+        after: Optional[int] = None) -> list[dict]:
+    rows = await db.execute(services.addresses_filter_query(street, city, country, after, limit))
+    return [row._asdict() for row in rows]
+
+
+async def get_orders(db: AsyncSession, **filters) -> list[models.Order]:
+    return (await db.scalars(services.orders_query(**filters))).all()
+
+
+async def get_order_by_id(
+        db: AsyncSession, order_id: int,
+        with_items: bool = True, with_address: bool = False) -> Optional[models.Order]:
+    query = services.order_query(with_items, with_address).where(models.Order.id == order_id)
+    return (await db.scalars(query)).first()
+
+
+async def get_order_by_status(db: AsyncSession, status: str, with_items: bool = True) -> list[models.Order]:
+    return (await db.scalars(services.order_query(with_items).where(models.Order.status == status))).all()
+
+
+async def get_order_status_by_id(db: AsyncSession, order_id: int) -> Optional[str]:
+    return await db.scalar(select(models.Order.status).where(models.Order.id == order_id))
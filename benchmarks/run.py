@@ -0,0 +1,344 @@
+"""Benchmark the REST and JSON-RPC endpoints against a seeded SQLite database.
+
+Usage:
+    python benchmarks/run.py --products 20000 --orders 20000 --output results.json
+    python benchmarks/run.py --output new.json --compare results.json
+
+Every scenario runs through the Flask test client and through a real
+threaded WSGI server. Each reports throughput, p50/p95/p99 latency and SQL
+statement counts. The run exits non-zero if any request failed. ``--compare``
+prints the change against an earlier results file and also exits non-zero
+if any p95 latency regressed by more than ``--threshold`` percent or if the
+earlier run had failed requests, which makes its latencies meaningless.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--addresses", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--items-per-order", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hot-products", type=int, default=5, help="products shared by contended orders")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database", help="SQLite file to use (a temporary one by default)")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p95 regression in percent")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Point the app at SQLite and keep Celery work in-process, before anything imports ``database``."""
+    path = args.database or os.path.join(tempfile.mkdtemp(prefix="products-bench-"), "bench.db")
+    if os.path.exists(path):
+        os.remove(path)
+    os.environ["DATABASE_URI"] = f"sqlite:///{path}"
+    os.environ.setdefault("ORDER_EVENTS_PATH", os.path.join(os.path.dirname(path), "order_events.jsonl"))
+    return path
+
+
+def seed(args):
+    from sqlalchemy import insert
+
+    import database
+    import models
+
+    rng = random.Random(args.seed)
+    models.Base.metadata.create_all(database.engine)
+
+    with database.engine.begin() as conn:
+        conn.execute(insert(models.Product), [
+            {"id": i, "name": f"product {i}", "color": rng.choice(["red", "green", "blue", "black"]),
+             "weight": rng.randint(1, 5000), "price": rng.randint(1, 10000), "inventory": 10 ** 9}
+            for i in range(1, args.products + 1)
+        ])
+        conn.execute(insert(models.Address), [
+            {"id": i, "country": f"country {i % 20}", "city": f"city {i % 200}", "street": f"street {i}"}
+            for i in range(1, args.addresses + 1)
+        ])
+        conn.execute(insert(models.Order), [
+            {"id": i, "status": "pending", "address_id": rng.randint(1, args.addresses)}
+            for i in range(1, args.orders + 1)
+        ])
+        conn.execute(insert(models.OrderItem), [
+            {"order_id": order_id, "product_id": rng.randint(1, args.products), "quantity": rng.randint(1, 5)}
+            for order_id in range(1, args.orders + 1)
+            for _ in range(args.items_per_order)
+        ])
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "after_cursor_execute", self._increment)
+
+    def _increment(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+class TestClientTransport:
+    name = "test_client"
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class WSGIServerTransport:
+    name = "wsgi_server"
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def request(self, method, path, body=None):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        try:
+            headers = {}
+            payload = None
+            if body is not None:
+                payload = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def scenarios(args):
+    """Each scenario maps a request number to ``(method, path, body)``."""
+    rng = random.Random(args.seed)
+    order_ids = itertools.count(args.orders + 1)
+    pending_orders = itertools.count(1)
+    id_lock = threading.Lock()
+
+    def next_id(counter):
+        with id_lock:
+            return next(counter)
+
+    def browse_catalog(i):
+        if i % 2:
+            return "GET", f"/products/{rng.randint(1, args.products)}/", None
+        return "GET", f"/products/?limit=100&after={rng.randint(0, max(args.products - 100, 0))}", None
+
+    def create_order_contended(i):
+        items = [{"product_id": rng.randint(1, args.hot_products), "quantity": 1} for _ in range(args.items_per_order)]
+        order = {"id": next_id(order_ids), "status": "pending", "address_id": rng.randint(1, args.addresses),
+                 "productitems": items}
+        return "POST", "/orders/", order
+
+    def update_status(i):
+        return "PUT", f"/orders/{next_id(pending_orders)}/status/", {"status": "completed"}
+
+    def list_orders(i):
+        paths = ("/orders/?limit=500", "/orders/status/?status=pending&compact=1",
+                 f"/addresses/?country=country%20{i % 20}")
+        return "GET", paths[i % len(paths)], None
+
+    def rpc_bulk_create(i):
+        orders = [
+            {"id": next_id(order_ids), "status": "pending", "address_id": rng.randint(1, args.addresses),
+             "productitems": [{"product_id": rng.randint(1, args.products), "quantity": 1}]}
+            for _ in range(20)
+        ]
+        body = {"jsonrpc": "2.0", "method": "orders.bulk_create", "params": {"orders": orders}, "id": i}
+        return "POST", "/json-rpc", body
+
+    return {
+        "catalog_browsing": browse_catalog,
+        "order_creation_contended": create_order_contended,
+        "status_updates": update_status,
+        "bulk_listing": list_orders,
+        "jsonrpc_bulk_create": rpc_bulk_create,
+    }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(transport, make_request, counter, args):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        method, path, body = make_request(i)
+        start = time.perf_counter()
+        try:
+            status = transport.request(method, path, body)
+        except Exception:
+            status = 599
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if status >= 400:
+                errors += 1
+
+    statements_before = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(args.requests)))
+    duration = time.perf_counter() - start
+    statements = counter.count - statements_before
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(len(latencies) / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "sql_statements": statements,
+        "sql_per_request": round(statements / len(latencies), 2) if latencies else 0.0,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print the p95 and errors of each scenario against the baseline.
+
+    Returns the scenarios whose p95 regressed by more than ``threshold``
+    percent and those that are invalid because either run had errors.
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+
+    regressed, invalid = [], []
+    print(f"{'scenario':45} {'p95 before':>12} {'p95 after':>12} {'change':>9} {'errors':>13}")
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            print(f"{name:45} {'-':>12} {current['p95_ms']:>12.3f} {'new':>9} {current['errors']:>13}")
+            if current["errors"]:
+                invalid.append(name)
+            continue
+        change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0.0
+        errors = f"{previous.get('errors', 0)} -> {current['errors']}"
+        print(f"{name:45} {previous['p95_ms']:>12.3f} {current['p95_ms']:>12.3f} {change:>8.1f}% {errors:>13}")
+        if current["errors"] or previous.get("errors"):
+            invalid.append(name)
+        elif change > threshold:
+            regressed.append(name)
+    return regressed, invalid
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    seed(args)
+
+    import celery_
+    import database
+    from app import app
+
+    celery_.app.conf.task_always_eager = True
+    counter = StatementCounter(database.engine)
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "volumes": {"products": args.products, "addresses": args.addresses, "orders": args.orders,
+                        "items_per_order": args.items_per_order},
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "scenarios": {},
+    }
+
+    workload = scenarios(args)
+    for transport_class in (TestClientTransport, WSGIServerTransport):
+        transport = transport_class(app)
+        try:
+            for name, make_request in workload.items():
+                key = f"{name}[{transport.name}]"
+                results["scenarios"][key] = result = run_scenario(transport, make_request, counter, args)
+                print(f"{key:45} {result['throughput_rps']:>9.1f} req/s  p50 {result['p50_ms']:.2f} ms  "
+                      f"p95 {result['p95_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms  "
+                      f"{result['sql_per_request']:.1f} sql/req  {result['errors']} errors")
+        finally:
+            transport.close()
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = False
+    if args.compare:
+        regressed, invalid = compare(results, args.compare, args.threshold)
+        if invalid:
+            print(f"Invalid comparison, requests failed in: {', '.join(invalid)}")
+            failed = True
+        if regressed:
+            print(f"p95 regressed by more than {args.threshold}% in: {', '.join(regressed)}")
+            failed = True
+    else:
+        invalid = [name for name, result in results["scenarios"].items() if result["errors"]]
+        if invalid:
+            print(f"Requests failed in: {', '.join(invalid)}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+import redis
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", 300))
+CACHE_LOCK_TTL = float(os.getenv("CACHE_LOCK_TTL", 5))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", 2))
+VERSION_TTL = int(os.getenv("VERSION_TTL", 24 * 3600))
+
+# Store a loaded value only while the loader still holds the key's lock.
+STORE_IF_LOCKED_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class ReadThroughCache:
+    """Read-through JSON cache on top of Redis.
+
+    On a miss only the caller holding the per-key lock runs the loader; the
+    others poll for the value it stores (single flight). ``invalidate`` also
+    deletes the lock, and a loaded value is only stored while its loader still
+    holds the lock, so a load that raced a write cannot cache the old value.
+    Without a client, or when Redis fails, every call goes straight to the
+    loader.
+    """
+
+    def __init__(self, client=None, ttl=CACHE_TTL, lock_ttl=CACHE_LOCK_TTL,
+                 lock_wait=CACHE_LOCK_WAIT, poll_interval=0.02):
+        self.client = client
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self.poll_interval = poll_interval
+
+    def get_or_load(self, key, loader):
+        if self.client is None:
+            return loader()
+
+        try:
+            cached = self.client.get(key)
+            if cached is not None:
+                return json.loads(cached)
+
+            lock_key = f"{key}:lock"
+            token = uuid.uuid4().hex
+            acquired = self.client.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000))
+        except redis.RedisError:
+            return loader()
+
+        if acquired:
+            try:
+                value = loader()
+                if value is not None:
+                    self._store(key, value, lock_key, token)
+                return value
+            finally:
+                self._release(lock_key, token)
+
+        deadline = time.monotonic() + self.lock_wait
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                cached = self.client.get(key)
+                if cached is not None:
+                    return json.loads(cached)
+                if not self.client.exists(lock_key):
+                    break
+        except redis.RedisError:
+            pass
+        return loader()
+
+    def invalidate(self, *keys):
+        if self.client is None or not keys:
+            return
+        try:
+            self.client.delete(*keys, *(f"{key}:lock" for key in keys))
+        except redis.RedisError as e:
+            print(f"Failed to invalidate cache keys {keys}: {e}")
+
+    def _store(self, key, value, lock_key, token):
+        try:
+            self.client.eval(STORE_IF_LOCKED_SCRIPT, 2, key, lock_key, token, json.dumps(value), self.ttl)
+        except redis.RedisError as e:
+            print(f"Failed to cache {key}: {e}")
+
+    def _release(self, lock_key, token):
+        try:
+            if self.client.get(lock_key) in (token, token.encode()):
+                self.client.delete(lock_key)
+        except redis.RedisError:
+            pass
+
+
+class VersionStore:
+    """Change counters per table and per row, for ETag and Last-Modified headers.
+
+    ``get`` returns ``(etag, modified_at)`` for a table or one of its rows and
+    ``bump`` moves both on after a write. Each counter starts with a random
+    id, so counters recreated after Redis lost or expired them never repeat
+    an old ETag. Counters need Redis: a per-process store would let other
+    workers answer 304 for rows this one changed, so without a client
+    ``get`` returns None and responses go out without validators.
+    """
+
+    def __init__(self, client=None, clock=time.time, ttl=VERSION_TTL):
+        self.client = client
+        self.clock = clock
+        self.ttl = ttl
+
+    @staticmethod
+    def key(table: str, row_id=None) -> str:
+        return f"version:{table}" if row_id is None else f"version:{table}:{row_id}"
+
+    def get(self, table: str, row_id=None) -> Optional[tuple[str, float]]:
+        if self.client is None:
+            return None
+        key = self.key(table, row_id)
+        counter_id, n, at = self.client.hmget(key, "id", "n", "at")
+        if counter_id is None or at is None:
+            pipe = self.client.pipeline()
+            pipe.hsetnx(key, "id", uuid.uuid4().hex[:12])
+            pipe.hsetnx(key, "at", self.clock())
+            pipe.expire(key, self.ttl)
+            pipe.hmget(key, "id", "n", "at")
+            counter_id, n, at = pipe.execute()[-1]
+        return f"{counter_id.decode()}-{int(n or 0)}", float(at)
+
+    def bump(self, table: str, *row_ids):
+        """Move the table's counter and those of ``row_ids`` on."""
+        if self.client is None:
+            return
+        keys = [self.key(table)] + [self.key(table, row_id) for row_id in row_ids]
+        now = self.clock()
+        try:
+            pipe = self.client.pipeline()
+            for key in keys:
+                pipe.hsetnx(key, "id", uuid.uuid4().hex[:12])
+                pipe.hincrby(key, "n", 1)
+                pipe.hset(key, "at", now)
+                pipe.expire(key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Failed to bump versions {keys}: {e}")
+
+
+def product_key(product_id: int) -> str:
+    return f"product:{product_id}"
+
+
+def address_key(address_id: int) -> str:
+    return f"address:{address_id}"
+
+
+entity_cache = ReadThroughCache()
+versions = VersionStore()
@@ -4,11 +4,26 @@ from celery import Celery
 
 broker_url = "redis://redis:6379/0"
 
-app = Celery("tasks", broker=broker_url)
+HOT_INVENTORY_FLUSH_INTERVAL = float(os.getenv("HOT_INVENTORY_FLUSH_INTERVAL", 2))
+HOT_INVENTORY_RECONCILE_INTERVAL = float(os.getenv("HOT_INVENTORY_RECONCILE_INTERVAL", 60))
+
+# The worker is started with -A celery_, so the task module has to be listed here to be registered.
+app = Celery("tasks", broker=broker_url, include=["tasks"])
 
 app.conf.update(
     result_backend="redis://localhost:6379/0",
     task_serializer="json",
     result_serializer="json",
     accept_content=["json"],
+    beat_schedule={
+        "flush-hot-inventory": {
+            "task": "tasks.flush_hot_inventory",
+            "schedule": HOT_INVENTORY_FLUSH_INTERVAL,
+            "options": {"expires": HOT_INVENTORY_FLUSH_INTERVAL},
+        },
+        "reconcile-hot-inventory": {
+            "task": "tasks.reconcile_hot_inventory",
+            "schedule": HOT_INVENTORY_RECONCILE_INTERVAL,
+        },
+    },
 )
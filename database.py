@@ -1,19 +1,387 @@
+import itertools
 import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from inspect import isgeneratorfunction
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import Select, create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from metrics import Histogram, histogram_lines
 
 load_dotenv()
 
-SQLALCHEMY_DATABASE_URL = "mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}@{os.getenv('MYSQL_HOST')}:{os.getenv('MYSQL_PORT')}/{os.getenv('MYSQL_DATABASE')}" # noqa
-mysql_port = os.environ.get("MYSQL_PORT")
-engine = create_engine(
-    f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}@{os.getenv('MYSQL_HOST')}:{os.getenv('MYSQL_PORT')}/{os.getenv('MYSQL_DATABASE')}",   # noqa
-    poolclass=QueuePool,
-    pool_pre_ping=True
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URI") or f"mysql+pymysql://{os.getenv('MYSQL_USER')}:{os.getenv('MYSQL_PASSWORD')}@{os.getenv('MYSQL_HOST')}:{os.getenv('MYSQL_PORT')}/{os.getenv('MYSQL_DATABASE')}"  # noqa
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_USE_LIFO = os.getenv("DB_POOL_USE_LIFO", "false").lower() in ("1", "true", "yes")
+# Seconds a SQLite connection waits for the write lock before "database is locked".
+DB_SQLITE_BUSY_TIMEOUT = float(os.getenv("DB_SQLITE_BUSY_TIMEOUT", 30))
+
+# Comma separated replica URLs; read-only service calls are spread over them.
+DATABASE_REPLICA_URIS = [uri.strip() for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()]
+# "round_robin" or "least_connections".
+DB_REPLICA_STRATEGY = os.getenv("DB_REPLICA_STRATEGY", "round_robin")
+DB_REPLICA_RETRY_INTERVAL = float(os.getenv("DB_REPLICA_RETRY_INTERVAL", 10))
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", 5))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_latency = Histogram()
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.checkout_latency.observe(time.perf_counter() - start)
+
+
+def serialize_sqlite_writers(sqlite_engine):
+    """Open every SQLite transaction with ``BEGIN IMMEDIATE``.
+
+    SQLite ignores ``FOR UPDATE`` and pysqlite only begins a transaction
+    before a data change, so two writers could read the same rows and then
+    race to write them, failing the version checks. Taking the write lock when
+    the transaction begins makes writers queue the way MySQL row locks do.
+    """
+    @event.listens_for(sqlite_engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(sqlite_engine, "begin")
+    def _begin_immediate(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def create_db_engine(
+        url=DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        pool_use_lifo=DB_POOL_USE_LIFO,
+        **kwargs):
+    """Build an engine with the process-wide pool settings.
+
+    SQLite URLs keep SQLAlchemy's default pool, which suits its threading model,
+    and serialize their writers (see ``serialize_sqlite_writers``).
+    """
+    if make_url(url).get_backend_name() == "sqlite":
+        connect_args = {"timeout": DB_SQLITE_BUSY_TIMEOUT, **kwargs.pop("connect_args", {})}
+        sqlite_engine = create_engine(url, connect_args=connect_args, **kwargs)
+        serialize_sqlite_writers(sqlite_engine)
+        return sqlite_engine
+    return create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=pool_pre_ping,
+        pool_use_lifo=pool_use_lifo,
+        **kwargs,
+    )
+
+
+def pool_stats(db_engine=None) -> dict:
+    pool = (db_engine or engine).pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            timeout=pool.timeout(),
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        stats["timeouts"] = pool.timeouts
+        stats["checkout_latency"] = pool.checkout_latency.snapshot()
+    return stats
+
+
+def pool_metric_lines(db_engine=None) -> list[str]:
+    """Pool gauges and the checkout latency histogram in Prometheus text format."""
+    pool = (db_engine or engine).pool
+    stats = pool_stats(db_engine)
+    lines = []
+    for key in ("size", "checked_in", "checked_out", "overflow"):
+        if key in stats:
+            lines += [f"# TYPE db_pool_{key} gauge", f"db_pool_{key} {stats[key]}"]
+    if isinstance(pool, InstrumentedQueuePool):
+        lines += ["# TYPE db_pool_timeouts_total counter", f"db_pool_timeouts_total {pool.timeouts}"]
+        lines.append("# TYPE db_pool_checkout_seconds histogram")
+        lines += histogram_lines("db_pool_checkout_seconds", {}, pool.checkout_latency)
+    return lines
+
+
+ASYNC_DRIVERS = {"mysql": "mysql+aiomysql", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_database_url(url=DATABASE_URL):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+
+def create_async_db_engine(
+        url=DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        **kwargs):
+    """Async counterpart of ``create_db_engine`` using the same pool settings."""
+    url = async_database_url(url)
+    if url.get_backend_name() == "sqlite":
+        return create_async_engine(url, **kwargs)
+    return create_async_engine(
+        url,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=pool_pre_ping,
+        **kwargs,
+    )
+
+
+_async_engine = None
+
+
+def get_async_engine():
+    """Create the async engine on first use, so the async driver is only needed in ASGI mode."""
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    return _async_session_factory(bind=get_async_engine())
+
+
+class Replica:
+    """One replica engine, with its checked-out connection count and health."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.in_use = 0
+        self.healthy = True
+        self.failures = 0
+        self.retry_at = 0.0
+        event.listen(engine, "checkout", self._checkout)
+        event.listen(engine, "checkin", self._checkin)
+
+    def _checkout(self, *args):
+        self.in_use += 1
+
+    def _checkin(self, *args):
+        self.in_use -= 1
+
+    def ping(self) -> bool:
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return True
+        except OperationalError as e:
+            print(f"Replica {self.engine.url!r} is still down: {e}")
+            return False
+
+
+class ReplicaPool:
+    """Replica engines that read-only sessions pick from.
+
+    ``strategy`` is ``round_robin`` or ``least_connections`` (fewest
+    checked-out connections). A replica that fails a query is taken out and,
+    every ``retry_interval`` seconds, has to answer ``SELECT 1`` before it gets
+    traffic again. With no healthy replica ``choose`` returns None and reads
+    go to the primary.
+    """
+
+    def __init__(self, engines=(), strategy=DB_REPLICA_STRATEGY, retry_interval=DB_REPLICA_RETRY_INTERVAL,
+                 clock=time.monotonic):
+        if strategy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica strategy {strategy!r}")
+        self.replicas = [Replica(engine) for engine in engines]
+        self.strategy = strategy
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def _retry(self, replica: Replica):
+        """Ping a failed replica whose retry time has come; one caller pings at a time."""
+        with self._lock:
+            now = self.clock()
+            if replica.healthy or replica.retry_at > now:
+                return
+            replica.retry_at = now + self.retry_interval
+        if replica.ping():
+            replica.healthy = True
+
+    def choose(self):
+        for replica in self.replicas:
+            if not replica.healthy and replica.retry_at <= self.clock():
+                self._retry(replica)
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.strategy == "least_connections":
+            return min(healthy, key=lambda replica: replica.in_use).engine
+        return healthy[next(self._turn) % len(healthy)].engine
+
+    def mark_down(self, engine):
+        for replica in self.replicas:
+            if replica.engine is engine:
+                print(f"Replica {engine.url!r} failed, reading from the others until it answers again")
+                replica.healthy = False
+                replica.failures += 1
+                replica.retry_at = self.clock() + self.retry_interval
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "url": repr(replica.engine.url),
+                "healthy": replica.healthy,
+                "failures": replica.failures,
+                "in_use": replica.in_use,
+                "pool": pool_stats(replica.engine),
+            }
+            for replica in self.replicas
+        ]
+
+
+class BatchSession(Session):
+    """Session that can hold one transaction open across several service calls.
+
+    While ``info["batch"]`` is set, ``commit`` only flushes, ``close`` keeps
+    the transaction, and ``rollback`` marks the batch as failed. Whoever
+    started the batch commits or rolls back once it calls ``end_batch``.
+    """
+
+    def begin_batch(self):
+        self.info["batch"] = True
+        self.info["batch_failed"] = False
+
+    def end_batch(self, commit: bool):
+        self.info["batch"] = False
+        if commit and not self.info.get("batch_failed"):
+            super().commit()
+        else:
+            super().rollback()
+
+    def commit(self):
+        if self.info.get("batch"):
+            self.flush()
+        else:
+            super().commit()
+
+    def rollback(self):
+        if self.info.get("batch"):
+            self.info["batch_failed"] = True
+        super().rollback()
+
+    def close(self):
+        if not self.info.get("batch"):
+            super().close()
+
+
+class RoutingSession(BatchSession):
+    """Session that sends the queries of read-only service calls to a replica.
+
+    A query goes to a replica only inside ``reading()``, when it is a plain
+    SELECT (no ``FOR UPDATE``), and while the session has not written, is not
+    running a batch and was not pinned with ``info["primary"]``. Everything
+    else uses the primary bind. The replica used last is kept in
+    ``info["replica"]`` so a failed read can be retried on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        writing = self._flushing or (clause is not None and (
+            not isinstance(clause, Select) or clause._for_update_arg is not None))
+        if writing:
+            self.info["wrote"] = True
+        elif (self.info.get("read_only") and not self.info.get("wrote") and not self.info.get("primary")
+              and not self.info.get("batch")):
+            replica = replicas.choose()
+            if replica is not None:
+                self.info["replica"] = replica
+                return replica
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+    @contextmanager
+    def reading(self):
+        outer = self.info.get("read_only", False)
+        self.info["read_only"] = True
+        try:
+            yield self
+        finally:
+            self.info["read_only"] = outer
+
+
+def read_only(fn):
+    """Let a service function that only reads run its queries on a replica.
+
+    The function takes the session as its first argument. When a replica
+    fails mid-call it is taken out of the pool and the call is run again on
+    the primary. Generators read on the replica for as long as they are
+    iterated and are not retried.
+    """
+    if isgeneratorfunction(fn):
+        @wraps(fn)
+        def generator_wrapper(db, *args, **kwargs):
+            if not isinstance(db, RoutingSession):
+                yield from fn(db, *args, **kwargs)
+                return
+            with db.reading():
+                yield from fn(db, *args, **kwargs)
+        return generator_wrapper
+
+    @wraps(fn)
+    def wrapper(db, *args, **kwargs):
+        if not isinstance(db, RoutingSession):
+            return fn(db, *args, **kwargs)
+        db.info.pop("replica", None)
+        try:
+            with db.reading():
+                return fn(db, *args, **kwargs)
+        except OperationalError:
+            replica = db.info.pop("replica", None)
+            if replica is None:
+                raise
+            replicas.mark_down(replica)
+            db.rollback()
+            return fn(db, *args, **kwargs)
+    return wrapper
+
+
+engine = create_db_engine()
+replicas = ReplicaPool([create_db_engine(uri) for uri in DATABASE_REPLICA_URIS])
+SessionLocal = sessionmaker(
+    class_=RoutingSession, autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+_async_session_factory = async_sessionmaker(autoflush=False, expire_on_commit=False)
 Base = declarative_base()
@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+project_root = os.path.abspath(os.path.dirname(__file__))
+
+ORDER_EVENTS_PATH = os.getenv("ORDER_EVENTS_PATH", os.path.join(project_root, "order_events.jsonl"))
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", 500))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", 1.0))
+
+
+def make_event(order_id: int, status: str) -> dict:
+    return {"order_id": order_id, "status": status, "at": datetime.now(timezone.utc).isoformat()}
+
+
+class EventBatcher:
+    """Buffers events and appends them to a JSON-lines file in batches.
+
+    A batch is written when ``batch_size`` events are buffered or
+    ``flush_interval`` seconds after the first buffered event, whichever
+    comes first, as a single append.
+    """
+
+    def __init__(self, path, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._timer = None
+
+    def add(self, event: dict):
+        line = json.dumps(event, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch_size
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if lines:
+                self._write(lines)
+
+    def _write(self, lines):
+        try:
+            with open(self.path, "a") as file:
+                file.write("".join(lines))
+        except OSError as e:
+            print(f"Error while writing {len(lines)} order events: {e}")
+
+
+def replay(path=ORDER_EVENTS_PATH):
+    """Yield the events stored in ``path`` in the order they were written."""
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+order_events = EventBatcher(ORDER_EVENTS_PATH)
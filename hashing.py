@@ -0,0 +1,85 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Any werkzeug method string, e.g. "pbkdf2:sha256:600000" or "scrypt:32768:8:1".
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", 2))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", 32))
+
+
+class HasherBusy(Exception):
+    """Raised when more hashes are waiting than ``HASH_QUEUE_SIZE`` allows."""
+
+
+class WerkzeugHasher:
+    """Password hasher with a configurable werkzeug method and cost."""
+
+    def __init__(self, method: str = PASSWORD_HASH_METHOD):
+        self.method = method
+
+    @cached_property
+    def _reference_hash(self) -> str:
+        return self.hash("not a password")
+
+    @property
+    def prefix(self) -> str:
+        """``method:params`` of new hashes; werkzeug fills in defaults, so it is read off a real hash."""
+        return self._reference_hash.split("$", 1)[0]
+
+    def hash(self, password: str) -> str:
+        return generate_password_hash(password, self.method)
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return check_password_hash(password_hash, password)
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        return password_hash.split("$", 1)[0] != self.prefix
+
+
+class HashingPool:
+    """Runs hashes on a few dedicated threads so a login burst cannot take every request worker.
+
+    At most ``workers`` hashes run at once and at most ``queue_size`` more
+    wait. Beyond that ``HasherBusy`` is raised right away instead of queueing.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_size: int = HASH_QUEUE_SIZE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashing")
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("Too many password hashes in progress")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+hasher = WerkzeugHasher()
+pool = HashingPool()
+
+
+def hash_password(password: str) -> str:
+    return pool.run(hasher.hash, password)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return pool.run(hasher.verify, password_hash, password)
+
+
+def verify_dummy(password: str) -> bool:
+    """Spend the same time as a real check, so unknown usernames cannot be told apart by timing."""
+    verify_password(hasher._reference_hash, password)
+    return False
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return hasher.needs_rehash(password_hash)
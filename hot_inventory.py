@@ -0,0 +1,450 @@
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Optional
+
+import redis
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import aggregates
+import models
+from schemas import OrderStatus
+
+HOT_INVENTORY_LOCK_TTL = int(os.getenv("HOT_INVENTORY_LOCK_TTL", 60))
+
+SKUS_KEY = "hot:skus"
+DELTA_KEY = "hot:delta"
+BATCHES_KEY = "hot:batches"
+LOCK_KEY = "hot:lock"
+
+# KEYS: stock keys..., delta hash. ARGV: quantities..., product ids...
+RESERVE_SCRIPT = """
+local n = #KEYS - 1
+for i = 1, n do
+    local stock = tonumber(redis.call('GET', KEYS[i]))
+    if stock == nil or stock < tonumber(ARGV[i]) then
+        return 0
+    end
+end
+for i = 1, n do
+    redis.call('DECRBY', KEYS[i], ARGV[i])
+    redis.call('HINCRBY', KEYS[n + 1], ARGV[n + i], -tonumber(ARGV[i]))
+end
+return 1
+"""
+
+# KEYS: stock keys..., delta hash. ARGV: quantities..., product ids... Returns the ids no longer hot.
+RELEASE_SCRIPT = """
+local n = #KEYS - 1
+local cold = {}
+for i = 1, n do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('INCRBY', KEYS[i], ARGV[i])
+        redis.call('HINCRBY', KEYS[n + 1], ARGV[n + i], ARGV[i])
+    else
+        table.insert(cold, ARGV[n + i])
+    end
+end
+return cold
+"""
+
+# KEYS: stock key, delta hash. ARGV: new stock, product id. Returns the old stock, or nil when not hot.
+SET_SCRIPT = """
+local old = redis.call('GET', KEYS[1])
+if not old then
+    return nil
+end
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('HINCRBY', KEYS[2], ARGV[2], tonumber(ARGV[1]) - tonumber(old))
+return tonumber(old)
+"""
+
+# KEYS: delta hash, batch queue, new batch key. ARGV: batch id.
+SEAL_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[3])
+redis.call('RPUSH', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+def counter_fields(delta: aggregates.SalesDelta) -> dict[str, int]:
+    """``hot:delta`` fields for the counter changes of orders with hot products.
+
+    Stock deltas are keyed by the bare product id; counters by ``kind:key``.
+    """
+    fields = {f"orders:{OrderStatus(status).value}": count for status, count in delta.orders.items() if count}
+    for product_id in delta.units:
+        fields[f"units:{product_id}"] = delta.units[product_id]
+        fields[f"revenue:{product_id}"] = delta.revenue[product_id]
+    return fields
+
+
+def split_fields(fields: dict) -> tuple[dict[int, int], aggregates.SalesDelta]:
+    """Stock deltas and counter changes from the fields of a delta hash or batch."""
+    stock = {}
+    delta = aggregates.SalesDelta()
+    for field, value in fields.items():
+        field = field.decode() if isinstance(field, bytes) else str(field)
+        value = int(value)
+        kind, _, key = field.rpartition(":")
+        if not kind:
+            stock[int(key)] = value
+        elif kind == "orders":
+            delta.order(key, value)
+        elif kind == "units":
+            delta.units[int(key)] += value
+        elif kind == "revenue":
+            delta.revenue[int(key)] += value
+    return stock, delta
+
+
+def stock_key(product_id: int) -> str:
+    return f"hot:stock:{product_id}"
+
+
+def batch_key(batch_id: str) -> str:
+    return f"hot:batch:{batch_id}"
+
+
+class RedisInventory:
+    """Hot stock in Redis, shared by every web and Celery worker.
+
+    ``hot:skus`` is the set of hot product ids and ``hot:stock:<id>`` their
+    stock. Reservations and releases also add to the ``hot:delta`` hash,
+    which ``seal`` turns into a batch queued in ``hot:batches``.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._seal = client.register_script(SEAL_SCRIPT)
+        self._set = client.register_script(SET_SCRIPT)
+
+    def hot_ids(self, product_ids) -> set[int]:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return set()
+        flags = self.client.smismember(SKUS_KEY, product_ids)
+        return {product_id for product_id, flag in zip(product_ids, flags) if flag}
+
+    def all_hot_ids(self) -> set[int]:
+        return {int(product_id) for product_id in self.client.smembers(SKUS_KEY)}
+
+    def reserve(self, quantities: dict[int, int]) -> bool:
+        product_ids = sorted(quantities)
+        keys = [stock_key(product_id) for product_id in product_ids] + [DELTA_KEY]
+        args = [quantities[product_id] for product_id in product_ids] + product_ids
+        return bool(self._reserve(keys=keys, args=args))
+
+    def release(self, quantities: dict[int, int]) -> set[int]:
+        product_ids = sorted(quantities)
+        keys = [stock_key(product_id) for product_id in product_ids] + [DELTA_KEY]
+        args = [quantities[product_id] for product_id in product_ids] + product_ids
+        return {int(product_id) for product_id in self._release(keys=keys, args=args)}
+
+    def set_stock(self, product_id: int, stock: int) -> Optional[int]:
+        """Set the stock to ``stock`` and add the change to the pending delta; returns the old stock."""
+        return self._set(keys=[stock_key(product_id), DELTA_KEY], args=[stock, product_id])
+
+    def enable(self, product_id: int, stock: int) -> bool:
+        if not self.client.set(stock_key(product_id), stock, nx=True):
+            return False
+        self.client.sadd(SKUS_KEY, product_id)
+        return True
+
+    def disable(self, product_id: int):
+        self.client.srem(SKUS_KEY, product_id)
+        self.client.delete(stock_key(product_id))
+
+    def adjust(self, product_id: int, amount: int):
+        self.client.incrby(stock_key(product_id), amount)
+
+    def lock(self):
+        return self.client.lock(LOCK_KEY, timeout=HOT_INVENTORY_LOCK_TTL)
+
+    def snapshot(self, product_ids) -> tuple[dict[int, int], dict[int, int]]:
+        """Stock and pending deltas read in one MULTI, so no reservation lands in between.
+
+        Sealed batches only change under ``lock``, which the caller holds.
+        """
+        product_ids = list(product_ids)
+        pipe = self.client.pipeline()
+        pipe.mget([stock_key(product_id) for product_id in product_ids])
+        pipe.hgetall(DELTA_KEY)
+        for batch_id in self.client.lrange(BATCHES_KEY, 0, -1):
+            pipe.hgetall(batch_key(batch_id.decode()))
+        values, *batches = pipe.execute()
+        stock = {product_id: int(value) for product_id, value in zip(product_ids, values) if value is not None}
+        pending = defaultdict(int)
+        for batch in batches:
+            for product_id, delta in split_fields(batch)[0].items():
+                pending[product_id] += delta
+        return stock, dict(pending)
+
+    def count(self, fields: dict[str, int]):
+        """Add counter changes to ``hot:delta`` in one MULTI, so a concurrent seal takes all or none."""
+        pipe = self.client.pipeline()
+        for field, value in fields.items():
+            pipe.hincrby(DELTA_KEY, field, value)
+        pipe.execute()
+        return True
+
+    def seal(self) -> bool:
+        batch_id = uuid.uuid4().hex
+        return bool(self._seal(keys=[DELTA_KEY, BATCHES_KEY, batch_key(batch_id)], args=[batch_id]))
+
+    def batches(self) -> list[tuple[str, dict]]:
+        batch_ids = [batch_id.decode() for batch_id in self.client.lrange(BATCHES_KEY, 0, -1)]
+        return [(batch_id, self.client.hgetall(batch_key(batch_id))) for batch_id in batch_ids]
+
+    def drop_batch(self, batch_id: str):
+        pipe = self.client.pipeline()
+        pipe.delete(batch_key(batch_id))
+        pipe.lrem(BATCHES_KEY, 1, batch_id)
+        pipe.execute()
+
+
+class MemoryInventory:
+    """In-process stand-in with the same operations, for development and tests without Redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._skus = set()
+        self._stock = {}
+        self._delta = defaultdict(int)
+        self._batches = {}
+
+    def hot_ids(self, product_ids) -> set[int]:
+        with self._lock:
+            return self._skus & set(product_ids)
+
+    def all_hot_ids(self) -> set[int]:
+        with self._lock:
+            return set(self._skus)
+
+    def reserve(self, quantities: dict[int, int]) -> bool:
+        with self._lock:
+            if any(self._stock.get(product_id, -1) < quantity for product_id, quantity in quantities.items()):
+                return False
+            for product_id, quantity in quantities.items():
+                self._stock[product_id] -= quantity
+                self._delta[product_id] -= quantity
+            return True
+
+    def release(self, quantities: dict[int, int]) -> set[int]:
+        with self._lock:
+            for product_id, quantity in quantities.items():
+                if product_id in self._stock:
+                    self._stock[product_id] += quantity
+                    self._delta[product_id] += quantity
+            return set(quantities) - set(self._stock)
+
+    def set_stock(self, product_id: int, stock: int) -> Optional[int]:
+        with self._lock:
+            old = self._stock.get(product_id)
+            if old is not None:
+                self._stock[product_id] = stock
+                self._delta[product_id] += stock - old
+            return old
+
+    def enable(self, product_id: int, stock: int) -> bool:
+        with self._lock:
+            if product_id in self._stock:
+                return False
+            self._stock[product_id] = stock
+            self._skus.add(product_id)
+            return True
+
+    def disable(self, product_id: int):
+        with self._lock:
+            self._skus.discard(product_id)
+            self._stock.pop(product_id, None)
+
+    def adjust(self, product_id: int, amount: int):
+        with self._lock:
+            if product_id in self._stock:
+                self._stock[product_id] += amount
+
+    def lock(self):
+        return self._flush_lock
+
+    def snapshot(self, product_ids) -> tuple[dict[int, int], dict[int, int]]:
+        with self._lock:
+            pending = defaultdict(int)
+            for batch in [self._delta, *self._batches.values()]:
+                for product_id, delta in split_fields(batch)[0].items():
+                    pending[product_id] += delta
+            stock = {product_id: self._stock[product_id] for product_id in product_ids if product_id in self._stock}
+            return stock, dict(pending)
+
+    def count(self, fields: dict[str, int]):
+        with self._lock:
+            for field, value in fields.items():
+                self._delta[field] += value
+            return True
+
+    def seal(self) -> bool:
+        with self._lock:
+            if not self._delta:
+                return False
+            self._batches[uuid.uuid4().hex] = dict(self._delta)
+            self._delta = defaultdict(int)
+            return True
+
+    def batches(self) -> list[tuple[str, dict]]:
+        with self._lock:
+            return [(batch_id, dict(deltas)) for batch_id, deltas in self._batches.items()]
+
+    def drop_batch(self, batch_id: str):
+        with self._lock:
+            self._batches.pop(batch_id, None)
+
+
+store = MemoryInventory()
+
+
+def use_client(client):
+    """Keep hot stock in Redis through ``client``; None switches back to the in-process store."""
+    global store
+    store = MemoryInventory() if client is None else RedisInventory(client)
+
+
+def enable(db: Session, product_id: int) -> Optional[list[int]]:
+    """Flag a product as hot, seeding its Redis stock from the locked product row.
+
+    Pending deltas are flushed first so the seeded stock and the database
+    agree. Returns the products that flush wrote, or None for unknown products.
+    """
+    with store.lock():
+        flushed = _flush(db)
+        inventory = db.scalar(
+            select(models.Product.inventory).where(models.Product.id == product_id).with_for_update())
+        if inventory is None:
+            db.rollback()
+            return None
+        store.enable(product_id, inventory)
+        db.commit()
+        return flushed
+
+
+def disable(db: Session, product_id: int) -> list[int]:
+    """Stop treating a product as hot and write its pending deltas back to the database."""
+    store.disable(product_id)
+    return flush(db)
+
+
+def _journaled(db: Session, batch_id: str) -> bool:
+    return db.scalar(select(models.InventoryJournal.batch_id).where(
+        models.InventoryJournal.batch_id == batch_id)) is not None
+
+
+def _apply_batch(db: Session, batch_id: str, deltas: dict[int, int], counters: aggregates.SalesDelta) -> bool:
+    """Apply one sealed batch and its counter changes with its journal row; False when it was applied before.
+
+    Any other failure is raised after the rollback, leaving the batch sealed
+    in Redis for the next flush to retry.
+    """
+    if _journaled(db, batch_id):
+        db.rollback()
+        return False
+    try:
+        db.execute(insert(models.InventoryJournal).values(
+            batch_id=batch_id, products=len(deltas), applied_at=datetime.now(timezone.utc)))
+        changes = [
+            {"product_id": product_id, "delta": delta}
+            for product_id, delta in sorted(deltas.items()) if delta
+        ]
+        if changes:
+            product = models.Product.__table__
+            db.execute(
+                update(product)
+                .where(product.c.id == bindparam("product_id"))
+                .values(inventory=product.c.inventory + bindparam("delta"), version_id=product.c.version_id + 1),
+                changes,
+            )
+        counters.apply(db)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        # Only a journal row committed by a concurrent flush means the batch is done.
+        if isinstance(e, IntegrityError) and _journaled(db, batch_id):
+            db.rollback()
+            return False
+        raise
+
+
+def flush(db: Session) -> list[int]:
+    """Write the net hot stock changes to ``product.inventory``; returns the products written.
+
+    Orders with hot products also leave their status and sales counter
+    changes in ``hot:delta``, so the counter rows are written here, once per
+    batch, rather than by every order. The open ``hot:delta`` hash is first sealed into a batch with a fresh id,
+    so reservations made meanwhile go to a new hash. Each queued batch is then
+    applied in one transaction together with a row in ``inventory_journal``,
+    and only dropped from Redis after that commit. A batch left queued by a
+    crash is retried on the next run, and its journal row makes the retry a
+    no-op when the first attempt had already committed.
+    """
+    with store.lock():
+        return _flush(db)
+
+
+def _flush(db: Session) -> list[int]:
+    store.seal()
+    flushed = set()
+    for batch_id, fields in store.batches():
+        deltas, counters = split_fields(fields)
+        # A batch journaled before a crash still needs its products dropped from the caches.
+        _apply_batch(db, batch_id, deltas, counters)
+        flushed.update(deltas)
+        store.drop_batch(batch_id)
+    return sorted(flushed)
+
+
+def reconcile(db: Session, repair: bool = False) -> dict[int, dict]:
+    """Hot products whose stock differs from ``product.inventory`` plus the pending deltas.
+
+    The two agree unless stock changed outside this module, e.g. a cold path
+    order that raced a product being flagged hot. With ``repair`` the Redis
+    stock is corrected by the difference found.
+    """
+    with store.lock():
+        hot = store.all_hot_ids()
+        if not hot:
+            return {}
+        inventory = dict(db.execute(
+            select(models.Product.id, models.Product.inventory).where(models.Product.id.in_(hot))).all())
+        stock, pending = store.snapshot(hot)
+
+        report = {}
+        for product_id in sorted(hot):
+            expected = inventory.get(product_id, 0) + pending.get(product_id, 0)
+            if stock.get(product_id) != expected:
+                report[product_id] = {
+                    "stock": stock.get(product_id),
+                    "inventory": inventory.get(product_id),
+                    "pending": pending.get(product_id, 0),
+                    "drift": (stock.get(product_id) or 0) - expected,
+                }
+                if repair and product_id in stock:
+                    store.adjust(product_id, -report[product_id]["drift"])
+        return report
+
+
+def safe(fn, *args, default=None):
+    """Run a store call, returning ``default`` when Redis is unreachable."""
+    try:
+        return fn(*args)
+    except redis.RedisError as e:
+        print(f"Hot inventory unavailable: {e}")
+        return default
@@ -0,0 +1,156 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+
+import redis
+from flask import Response, current_app, g, request
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+import database
+import local_cache
+from cache import versions
+
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 300))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 1024 * 1024))
+
+
+class ResponseCache:
+    """Rendered 200 responses shared by every worker.
+
+    Keys carry the version the response was rendered at, so a write makes
+    the old entries unreachable instead of deleting them; they expire after
+    ``ttl``. Entries are kept in this process's LRU cache and, when a client
+    is set, in Redis.
+    """
+
+    def __init__(self, client=None, ttl=RESPONSE_CACHE_TTL, local=local_cache.response_cache):
+        self.client = client
+        self.ttl = ttl
+        self.local = local
+
+    def get(self, key: str):
+        record = self.local.get(key, None)
+        if record is not None or self.client is None:
+            return record
+        try:
+            stored = self.client.get(key)
+        except redis.RedisError as e:
+            print(f"Failed to read cached response {key}: {e}")
+            return None
+        if stored is None:
+            return None
+        record = json.loads(stored)
+        self.local.set(key, record)
+        return record
+
+    def set(self, key: str, record: dict):
+        self.local.set(key, record)
+        if self.client is None:
+            return
+        try:
+            self.client.set(key, json.dumps(record), ex=self.ttl)
+        except redis.RedisError as e:
+            print(f"Failed to cache response {key}: {e}")
+
+
+def request_key() -> str:
+    """Path plus sorted query args, so argument order does not split the cache."""
+    return f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+
+
+def not_modified(etag: str, modified_at=None, headers=None) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no If-None-Match was sent.
+
+    ``headers`` defaults to those of the current Flask request.
+    """
+    headers = request.headers if headers is None else headers
+    if_none_match = parse_etags(headers.get("If-None-Match"))
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if_modified_since = parse_date(headers.get("If-Modified-Since"))
+    if if_modified_since is not None and modified_at is not None:
+        return int(modified_at) <= if_modified_since.timestamp()
+    return False
+
+
+def validator_headers(etag=None, modified_at=None) -> dict:
+    headers = {}
+    if etag is not None:
+        headers["ETag"] = quote_etag(etag)
+    if modified_at is not None:
+        headers["Last-Modified"] = http_date(datetime.fromtimestamp(int(modified_at), timezone.utc))
+    # Clients may keep the body but must revalidate, which costs a 304 at most.
+    headers["Cache-Control"] = "no-cache"
+    return headers
+
+
+def set_validators(response: Response, etag=None, modified_at=None) -> Response:
+    response.headers.update(validator_headers(etag, modified_at))
+    return response
+
+
+def _replica_may_lag(response: Response, modified_at: float) -> bool:
+    """Whether the response may come from a replica that has not caught up with ``modified_at`` yet."""
+    if time.time() - modified_at >= database.READ_YOUR_WRITES_WINDOW:
+        return False
+    if response.is_streamed:
+        # The body is read after this returns, on whichever replica the stream picks.
+        return bool(database.replicas.replicas)
+    db = g.get("db")
+    return db is not None and db.info.get("replica") is not None
+
+
+def conditional(table: str, row_arg=None):
+    """Serve a GET view with an ETag and Last-Modified taken from the version of ``table``.
+
+    With ``row_arg`` the version is that of the row named by the view argument,
+    otherwise that of the whole table. A matching ``If-None-Match`` (or a
+    recent enough ``If-Modified-Since``) gets a 304 without running the view.
+    Without a version store the view runs as is, without validators.
+    Other 200 responses are cached by URL, query args and version. Streamed
+    responses and those over ``RESPONSE_CACHE_MAX_BYTES`` are not cached.
+    A view that read from a replica within ``READ_YOUR_WRITES_WINDOW`` of the
+    last write may have rendered rows older than the version, so its response
+    goes out without validators and is not cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version = versions.get(table, kwargs.get(row_arg) if row_arg else None)
+            except redis.RedisError as e:
+                print(f"Version store unavailable, serving {request.path} without validators: {e}")
+                version = None
+            if version is None:
+                return view(*args, **kwargs)
+            etag, modified_at = version
+
+            if not_modified(etag, modified_at):
+                return set_validators(Response(status=304), etag, modified_at)
+
+            key = f"response:{table}:{etag}:{request_key()}"
+            record = responses.get(key)
+            if record is not None:
+                response = Response(record["body"], mimetype=record["mimetype"])
+                response.headers.update(record["headers"])
+                return set_validators(response, etag, modified_at)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or _replica_may_lag(response, modified_at):
+                return response
+            if not response.is_streamed and len(response.get_data()) <= RESPONSE_CACHE_MAX_BYTES:
+                responses.set(key, {
+                    "body": response.get_data(as_text=True),
+                    "mimetype": response.mimetype,
+                    "headers": {name: value for name, value in response.headers.items() if name.startswith("X-")},
+                })
+            return set_validators(response, etag, modified_at)
+
+        return wrapper
+    return decorator
+
+
+responses = ResponseCache()
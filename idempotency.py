@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+import redis
+from flask import Response, current_app, jsonify, request
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", 30))
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# Conflicts and throttling may go away on retry, so they are not replayed.
+UNCACHED_STATUSES = {409, 429}
+
+
+class IdempotencyStore:
+    """Remembers the first response for each idempotency key.
+
+    ``begin`` claims a key for ``lock_ttl`` seconds or returns what is already
+    stored under it. ``complete`` replaces the claim with the response for
+    ``ttl`` seconds, and ``release`` drops the claim so the request can be
+    retried. Keys live in Redis when a client is set, and otherwise in a
+    dict that only this process sees.
+    """
+
+    def __init__(self, client=None, ttl=IDEMPOTENCY_TTL, lock_ttl=IDEMPOTENCY_LOCK_TTL, clock=time.monotonic):
+        self.client = client
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.clock = clock
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key: str, fingerprint: str):
+        """Claim ``key``; returns None when claimed, else the stored record."""
+        record = json.dumps({"state": "pending", "fingerprint": fingerprint})
+        if self.client is not None:
+            if self.client.set(key, record, nx=True, ex=self.lock_ttl):
+                return None
+            stored = self.client.get(key)
+            return json.loads(stored) if stored is not None else self.begin(key, fingerprint)
+
+        with self._lock:
+            now = self.clock()
+            stored = self._local.get(key)
+            if stored is not None and stored[1] > now:
+                return json.loads(stored[0])
+            if len(self._local) > 10000:
+                self._local = {k: v for k, v in self._local.items() if v[1] > now}
+            self._local[key] = (record, now + self.lock_ttl)
+            return None
+
+    def complete(self, key: str, record: dict):
+        value = json.dumps({**record, "state": "done"})
+        if self.client is not None:
+            self.client.set(key, value, ex=self.ttl)
+            return
+        with self._lock:
+            self._local[key] = (value, self.clock() + self.ttl)
+
+    def release(self, key: str):
+        if self.client is not None:
+            self.client.delete(key)
+            return
+        with self._lock:
+            self._local.pop(key, None)
+
+
+def request_fingerprint() -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.path}\n".encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _replay(record: dict) -> Response:
+    response = Response(record["body"], status=record["status"], mimetype=record["mimetype"])
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view):
+    """Replay the first response to requests repeated with the same ``Idempotency-Key`` header.
+
+    A retry with the same key and body gets the stored response without the
+    view running again. The same key with a different body is rejected with
+    422, and a retry that arrives while the first request is still running
+    gets 409. Requests without the header are not affected.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key:
+            return view(*args, **kwargs)
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+        key = f"idempotency:{request.path}:{idempotency_key}"
+        fingerprint = request_fingerprint()
+        try:
+            stored = store.begin(key, fingerprint)
+        except redis.RedisError as e:
+            print(f"Idempotency store unavailable, handling {key} without it: {e}")
+            return view(*args, **kwargs)
+
+        if stored is not None:
+            if stored["fingerprint"] != fingerprint:
+                return jsonify({"error": f"{IDEMPOTENCY_HEADER} was used with a different request"}), 422
+            if stored["state"] != "done":
+                return jsonify({"error": "A request with this idempotency key is in progress"}), 409
+            return _replay(stored)
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            _release(key)
+            raise
+
+        if response.status_code < 500 and response.status_code not in UNCACHED_STATUSES:
+            try:
+                store.complete(key, {
+                    "fingerprint": fingerprint,
+                    "status": response.status_code,
+                    "mimetype": response.mimetype,
+                    "body": response.get_data(as_text=True),
+                })
+                return response
+            except redis.RedisError as e:
+                print(f"Failed to store response for idempotency key {key}: {e}")
+        _release(key)
+        return response
+
+    return wrapper
+
+
+def _release(key: str):
+    try:
+        store.release(key)
+    except redis.RedisError as e:
+        print(f"Failed to release idempotency key {key}: {e}")
+
+
+store = IdempotencyStore()
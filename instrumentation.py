@@ -0,0 +1,186 @@
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from flask import Response, g, request
+from sqlalchemy import event
+
+from metrics import Histogram, format_labels, histogram_lines
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_MS", 200)) / 1000
+MAX_TRACKED_SLOW_QUERIES = 200
+
+logger = logging.getLogger(__name__)
+
+_NORMALIZERS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|:\w+"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)"), "(?, ...)"),
+    (re.compile(r"\s+"), " "),
+)
+
+
+def normalize_sql(statement: str) -> str:
+    """Replace literals with ``?`` and collapse IN lists so similar queries group together."""
+    for pattern, replacement in _NORMALIZERS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class RequestStats:
+    __slots__ = ("statements", "db_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+class Registry:
+    """Process-wide aggregates of request and SQL timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_latency = defaultdict(Histogram)
+        self.request_db_time = defaultdict(Histogram)
+        self.requests = defaultdict(int)
+        self.statements = defaultdict(int)
+        self.slow_queries = defaultdict(int)
+
+    def record_request(self, endpoint, method, status, elapsed, stats):
+        with self._lock:
+            latency = self.request_latency[(endpoint, method)]
+            db_time = self.request_db_time[(endpoint, method)]
+            self.requests[(endpoint, method, status)] += 1
+            self.statements[(endpoint, method)] += stats.statements
+        latency.observe(elapsed)
+        db_time.observe(stats.db_time)
+
+    def record_slow_query(self, statement):
+        with self._lock:
+            if statement in self.slow_queries or len(self.slow_queries) < MAX_TRACKED_SLOW_QUERIES:
+                self.slow_queries[statement] += 1
+
+    def render(self) -> str:
+        with self._lock:
+            request_latency = dict(self.request_latency)
+            request_db_time = dict(self.request_db_time)
+            requests = dict(self.requests)
+            statements = dict(self.statements)
+            slow_queries = dict(self.slow_queries)
+
+        lines = ["# TYPE http_requests_total counter"]
+        for (endpoint, method, status), count in requests.items():
+            labels = {"endpoint": endpoint, "method": method, "status": status}
+            lines.append(f"http_requests_total{format_labels(labels)} {count}")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for (endpoint, method), histogram in request_latency.items():
+            lines += histogram_lines("http_request_duration_seconds", {"endpoint": endpoint, "method": method}, histogram)
+        lines.append("# TYPE http_request_db_seconds histogram")
+        for (endpoint, method), histogram in request_db_time.items():
+            lines += histogram_lines("http_request_db_seconds", {"endpoint": endpoint, "method": method}, histogram)
+        lines.append("# TYPE db_statements_total counter")
+        for (endpoint, method), count in statements.items():
+            labels = {"endpoint": endpoint, "method": method}
+            lines.append(f"db_statements_total{format_labels(labels)} {count}")
+        lines.append("# TYPE db_slow_queries_total counter")
+        for statement, count in slow_queries.items():
+            lines.append(f"db_slow_queries_total{format_labels({'query': statement})} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_time += elapsed
+    if elapsed >= SLOW_QUERY_SECONDS:
+        normalized = normalize_sql(statement)
+        registry.record_slow_query(normalized)
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, normalized)
+
+
+def instrument_engine(engine):
+    """Count statements and DB time per request for everything executed on ``engine``."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def current_stats():
+    return _current.get()
+
+
+def server_timing(elapsed: float, stats: RequestStats) -> str:
+    return f'app;dur={elapsed * 1000:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} statements"'
+
+
+def instrument_async_view(view):
+    """Give an async (Starlette) view the Server-Timing header and metrics ``init_app`` gives Flask views."""
+    @wraps(view)
+    async def wrapper(request):
+        token = _current.set(RequestStats())
+        start = time.perf_counter()
+        try:
+            response = await view(request)
+            elapsed = time.perf_counter() - start
+            stats = _current.get()
+            response.headers.append("Server-Timing", server_timing(elapsed, stats))
+            registry.record_request(view.__name__, request.method, response.status_code, elapsed, stats)
+            return response
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+def init_app(app, engine, extra_metrics=None):
+    """Time every request, emit Server-Timing headers and serve ``GET /metrics``.
+
+    ``extra_metrics`` is an optional callable returning more exposition lines.
+    """
+    instrument_engine(engine)
+
+    @app.before_request
+    def _start_request_timer():
+        g.instrumentation_token = _current.set(RequestStats())
+        g.instrumentation_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        stats = _current.get()
+        start = g.get("instrumentation_start")
+        if stats is None or start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        response.headers.add("Server-Timing", server_timing(elapsed, stats))
+        registry.record_request(request.endpoint or "unmatched", request.method, response.status_code, elapsed, stats)
+        return response
+
+    @app.teardown_request
+    def _reset_request_stats(exception=None):
+        token = g.pop("instrumentation_token", None)
+        if token is not None:
+            _current.reset(token)
+
+    @app.get("/metrics")
+    def metrics():
+        body = registry.render()
+        if extra_metrics is not None:
+            body += "\n".join(extra_metrics()) + "\n"
+        return Response(body, mimetype="text/plain; version=0.0.4")
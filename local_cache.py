@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+LOCAL_CACHE_SIZE = int(os.getenv("LOCAL_CACHE_SIZE", 10000))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 30))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache-invalidation")
+
+MISSING = object()
+
+
+class LRUCache:
+    """Bounded per-process cache with least-recently-used eviction and a TTL per entry.
+
+    ``get_or_load`` stores the loaded value only if the key was not
+    invalidated while the loader ran, so a load that raced a write cannot
+    put the old value back.
+    """
+
+    def __init__(self, maxsize=LOCAL_CACHE_SIZE, ttl=LOCAL_CACHE_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        self._data[key] = (value, self.clock() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        # invalidate() drops the token, telling this load its value may be stale.
+        token = object()
+        with self._lock:
+            self._loading[key] = token
+        try:
+            value = loader()
+            with self._lock:
+                if value is not None and self._loading.get(key) is token:
+                    self._set(key, value)
+        finally:
+            with self._lock:
+                if self._loading.get(key) is token:
+                    del self._loading[key]
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._loading.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._loading.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class LocalBus:
+    """In-process stand-in for the invalidation channel: delivers messages synchronously."""
+
+    def __init__(self):
+        self._handlers = []
+
+    def subscribe(self, handler):
+        self._handlers.append(handler)
+
+    def publish(self, message: dict):
+        self._dispatch(message)
+
+    def _dispatch(self, message: dict):
+        for handler in self._handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                print(f"Failed to handle bus message {message}: {e}")
+
+
+class RedisBus(LocalBus):
+    """Broadcasts messages to every worker through Redis pub/sub.
+
+    Messages are applied locally right away and then published. Each worker
+    receives its own message back, so handlers must be idempotent.
+    """
+
+    def __init__(self, client, channel=INVALIDATION_CHANNEL):
+        super().__init__()
+        self.client = client
+        self.channel = channel
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_message})
+            self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def publish(self, message: dict):
+        self._dispatch(message)
+        try:
+            self.client.publish(self.channel, json.dumps(message))
+        except redis.RedisError as e:
+            print(f"Failed to publish bus message {message}: {e}")
+
+    def _on_message(self, raw):
+        self._dispatch(json.loads(raw["data"]))
+
+
+product_cache = LRUCache()
+product_page_cache = LRUCache(maxsize=max(LOCAL_CACHE_SIZE // 10, 1))
+user_cache = LRUCache(ttl=USER_CACHE_TTL)
+response_cache = LRUCache(maxsize=max(LOCAL_CACHE_SIZE // 10, 1))
+
+caches = {
+    "product": product_cache,
+    "product_pages": product_page_cache,
+    "user": user_cache,
+    "responses": response_cache,
+}
+
+
+def _handle_invalidation(message: dict):
+    if message.get("type") != "invalidate":
+        return
+    cache = caches.get(message["cache"])
+    if cache is None:
+        return
+    if not message.get("keys"):
+        cache.clear()
+    for key in message.get("keys", ()):
+        cache.invalidate(key)
+
+
+def invalidate(cache_name: str, *keys):
+    """Drop ``keys`` (or every entry when none are given) from ``cache_name`` in all workers."""
+    bus.publish({"type": "invalidate", "cache": cache_name, "keys": list(keys)})
+
+
+def subscribe(handler):
+    bus.subscribe(handler)
+
+
+def use_bus(new_bus):
+    """Switch to ``new_bus``, keeping every handler subscribed so far."""
+    global bus
+    for handler in bus._handlers:
+        new_bus.subscribe(handler)
+    bus = new_bus
+    if isinstance(new_bus, RedisBus):
+        new_bus.start()
+
+
+def stats() -> dict:
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+bus = LocalBus()
+bus.subscribe(_handle_invalidation)
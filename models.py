@@ -1,11 +1,11 @@
-from enum import Enum
-
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import BigInteger, Column, DateTime, Enum, Index, Integer, String, ForeignKey
 from sqlalchemy.orm import relationship
-from werkzeug.security import generate_password_hash, check_password_hash
 
+import hashing
+import serializers
 from database import Base
+from schemas import OrderStatus
 
 db = SQLAlchemy()
 
@@ -22,10 +22,10 @@ class User(Base):
         self.set_password(password)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hashing.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hashing.verify_password(self.password_hash, password)
 
 
 class Product(Base):
@@ -36,8 +36,11 @@ class Product(Base):
     weight = Column(Integer, nullable=False)
     price = Column(Integer, nullable=False)
     inventory = Column(Integer, nullable=False)
+    version_id = Column(Integer, nullable=False, server_default="1")
     productitems = relationship("OrderItem", back_populates="product")
 
+    __mapper_args__ = {"version_id_col": version_id}
+
 
 class SubAddress(Base):
     __tablename__ = "sub_address"
@@ -49,6 +52,14 @@ class SubAddress(Base):
 
 class Address(Base):
     __tablename__ = "address"
+    __table_args__ = (
+        Index("ix_address_country_id", "country", "id"),
+        Index("ix_address_country_city_id", "country", "city", "id"),
+        Index("ix_address_city_id", "city", "id"),
+        Index("ix_address_country_city_street", "country", "city", "street"),
+        Index("ix_address_city_street", "city", "street"),
+        Index("ix_address_street", "street"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     country = Column(String(100), nullable=False)
     city = Column(String(100), nullable=False)
@@ -57,42 +68,62 @@ class Address(Base):
     sub_addresses = relationship("SubAddress", back_populates="main_address")
 
 
-class OrderStatus(str, Enum):
-    PENDING = "pending"
-    COMPLETED = "completed"
-    CANCELLED = "cancelled"
-
-
 class Order(Base):
     __tablename__ = "order"
+    __table_args__ = (
+        Index("ix_order_status_id", "status", "id"),
+        Index("ix_order_address_id_id", "address_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    status = Column(String(length=50), nullable=False, default=OrderStatus.PENDING.value)
+    status = Column(
+        Enum(OrderStatus, name="order_status", values_callable=lambda statuses: [status.value for status in statuses]),
+        nullable=False,
+        default=OrderStatus.PENDING,
+    )
     address_id = Column(Integer, ForeignKey("address.id"))
     address = relationship("Address", back_populates="orders")
-    productitems = relationship("OrderItem", back_populates="order", lazy='joined')
+    version_id = Column(Integer, nullable=False, server_default="1")
+    productitems = relationship("OrderItem", back_populates="order")
+
+    __mapper_args__ = {"version_id_col": version_id}
 
     def to_dict(self):
-        return {
-            "id": self.id,
-            "status": self.status,
-            "address_id": self.address_id,
-            "productitems": [item.to_dict() for item in self.productitems],
-        }
+        return serializers.order.one(self)
 
 
 class OrderItem(Base):
     __tablename__ = "orderitem"
     id = Column(Integer, primary_key=True, index=True)
     quantity = Column(Integer, nullable=False)
+    # Unit price when the order was placed; revenue is reversed at this price, not the current one.
+    price = Column(Integer)
     order_id = Column(Integer, ForeignKey("order.id"))
     order = relationship("Order", back_populates="productitems")
     product_id = Column(Integer, ForeignKey("product.id"))
     product = relationship("Product", back_populates="productitems")
 
     def to_dict(self):
-        return {
-            "id": self.id,
-            "quantity": self.quantity,
-            "product_id": self.product_id,
-            "order_id": self.order_id,
-        }
+        return serializers.order_item.one(self)
+
+
+class OrderStatusCount(Base):
+    __tablename__ = "order_status_count"
+    status = Column(
+        Enum(OrderStatus, name="order_status", values_callable=lambda statuses: [status.value for status in statuses]),
+        primary_key=True,
+    )
+    orders = Column(Integer, nullable=False, default=0)
+
+
+class ProductSales(Base):
+    __tablename__ = "product_sales"
+    product_id = Column(Integer, ForeignKey("product.id", ondelete="CASCADE"), primary_key=True)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(BigInteger, nullable=False, default=0, index=True)
+
+
+class InventoryJournal(Base):
+    __tablename__ = "inventory_journal"
+    batch_id = Column(String(32), primary_key=True)
+    products = Column(Integer, nullable=False)
+    applied_at = Column(DateTime, nullable=False)
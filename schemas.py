@@ -1,5 +1,13 @@
-from pydantic import BaseModel, SecretStr, NonNegativeInt, NonNegativeFloat
-from typing import List, Optional
+from enum import Enum
+
+from pydantic import BaseModel, SecretStr, NonNegativeInt, NonNegativeFloat, PositiveInt
+from typing import List, Literal, Optional
+
+
+class OrderStatus(str, Enum):
+    PENDING = "pending"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
 
 
 class ProductBase(BaseModel):
@@ -55,13 +63,13 @@ class AddressUpdate(AddressBase):
 
 
 class OrderItemBase(BaseModel):
-    quantity: int
+    quantity: PositiveInt
     product_id: int
 
 
 class OrderBase(BaseModel):
     id: int
-    status: str
+    status: OrderStatus
     address_id: int
     productitems: List[OrderItemBase]
 
@@ -70,11 +78,12 @@ class OrderBase(BaseModel):
 
 
 class OrderCreate(OrderBase):
-    pass
+    # New orders always start pending; other statuses are reached through status updates.
+    status: Literal[OrderStatus.PENDING] = OrderStatus.PENDING
 
 
 class OrderUpdate(BaseModel):
-    status: str
+    status: OrderStatus
 
 
 class UserBase(BaseModel):
@@ -96,5 +105,63 @@ class User(UserBase):
 
 
 class UserUpdate(BaseModel):
-    username: Optional[str]
-    password: Optional[SecretStr]
+    username: Optional[str] = None
+    password: Optional[SecretStr] = None
+
+
+class ProductRead(BaseModel):
+    id: int
+    name: str
+    color: str
+    weight: int
+    price: int
+    inventory: int
+
+    class Config:
+        from_attributes = True
+
+
+class AddressRead(BaseModel):
+    id: int
+    country: str
+    city: str
+    street: str
+
+    class Config:
+        from_attributes = True
+
+
+class OrderItemRead(BaseModel):
+    id: int
+    quantity: int
+    product_id: Optional[int]
+    order_id: Optional[int]
+
+    class Config:
+        from_attributes = True
+
+
+class OrderSummaryRead(BaseModel):
+    id: int
+    status: OrderStatus
+    address_id: Optional[int]
+
+    class Config:
+        from_attributes = True
+
+
+class OrderRead(OrderSummaryRead):
+    productitems: List[OrderItemRead]
+
+
+class OrderAddressRead(BaseModel):
+    id: int
+    status: OrderStatus
+    address: Optional[AddressRead]
+
+    class Config:
+        from_attributes = True
+
+
+class OrderDetailRead(OrderAddressRead):
+    productitems: List[OrderItemRead]
@@ -0,0 +1,212 @@
+import os
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+
+import local_cache
+
+SEARCH_MAX_PREFIX_TOKENS = int(os.getenv("SEARCH_MAX_PREFIX_TOKENS", 1000))
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text) -> list[str]:
+    return TOKEN_PATTERN.findall(str(text).lower()) if text is not None else []
+
+
+class SearchIndex:
+    """In-memory inverted index: token -> {document id: weight}.
+
+    Tokens are also kept in a sorted list so a query term can match every
+    token it is a prefix of (type-ahead). A document matches when every query
+    term matches one of its tokens. Documents are ranked by the summed weight
+    of the fields the terms were found in, with whole-word matches counting
+    double, then by id.
+    """
+
+    def __init__(self, fields: dict[str, int], max_prefix_tokens: int = SEARCH_MAX_PREFIX_TOKENS):
+        self.fields = fields
+        self.max_prefix_tokens = max_prefix_tokens
+        self.built = False
+        self.stale = False
+        self._postings = {}
+        self._tokens = []
+        self._documents = {}
+        # Changes made while ``load`` reads the database, replayed on top of what it read.
+        self._changes = None
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+
+    def _weights(self, document: dict) -> dict[str, int]:
+        weights = defaultdict(int)
+        for field, weight in self.fields.items():
+            for token in tokenize(document.get(field)):
+                weights[token] += weight
+        return weights
+
+    def add(self, doc_id: int, document: dict):
+        """Index ``document`` under ``doc_id``, replacing what was indexed for it before."""
+        weights = self._weights(document)
+        with self._lock:
+            self._add(doc_id, weights)
+            if self._changes is not None:
+                self._changes.append((doc_id, weights))
+
+    def _add(self, doc_id: int, weights: dict[str, int]):
+        self._remove(doc_id)
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._tokens, token)
+            postings[doc_id] = weight
+        self._documents[doc_id] = tuple(weights)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+            if self._changes is not None:
+                self._changes.append((doc_id, None))
+
+    def _remove(self, doc_id: int):
+        for token in self._documents.pop(doc_id, ()):
+            postings = self._postings[token]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+
+    def load(self, documents: Iterable[tuple[int, dict]]):
+        """Replace the whole index with ``documents``, sorting the token list once.
+
+        ``documents`` is read without holding the index lock, so searches and
+        incremental changes go on meanwhile; the changes are applied again on
+        top of the loaded documents.
+        """
+        with self._lock:
+            self.stale = False
+            self._changes = []
+        try:
+            postings = defaultdict(dict)
+            indexed = {}
+            for doc_id, document in documents:
+                weights = self._weights(document)
+                for token, weight in weights.items():
+                    postings[token][doc_id] = weight
+                indexed[doc_id] = tuple(weights)
+            with self._lock:
+                self._postings = dict(postings)
+                self._tokens = sorted(postings)
+                self._documents = indexed
+                for doc_id, weights in self._changes:
+                    if weights is None:
+                        self._remove(doc_id)
+                    else:
+                        self._add(doc_id, weights)
+                self.built = True
+        finally:
+            with self._lock:
+                self._changes = None
+
+    def _expand(self, term: str) -> list[str]:
+        start = bisect_left(self._tokens, term)
+        end = start
+        while (end < len(self._tokens) and end - start < self.max_prefix_tokens
+               and self._tokens[end].startswith(term)):
+            end += 1
+        return self._tokens[start:end]
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> tuple[int, list[int]]:
+        """Return the number of matching documents and the ids of the requested page."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+
+        with self._lock:
+            scores = None
+            # Start from the rarest term so the candidate set stays small.
+            for term in sorted(terms, key=lambda term: len(self._postings.get(term, ())) or len(self._tokens)):
+                term_scores = defaultdict(int)
+                for token in self._expand(term):
+                    bonus = 2 if token == term else 1
+                    for doc_id, weight in self._postings[token].items():
+                        if scores is None or doc_id in scores:
+                            term_scores[doc_id] = max(term_scores[doc_id], weight * bonus)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {doc_id: scores[doc_id] + score for doc_id, score in term_scores.items()}
+                if not scores:
+                    return 0, []
+
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        return len(ranked), ranked[offset:offset + limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"built": self.built, "stale": self.stale, "documents": len(self._documents),
+                    "tokens": len(self._tokens)}
+
+
+products = SearchIndex({"name": 3, "color": 1})
+addresses = SearchIndex({"street": 3, "city": 2, "country": 1})
+
+indexes = {
+    "product": products,
+    "address": addresses,
+}
+
+
+def ensure_built(name: str, load: Callable[[], Iterable[tuple[int, dict]]]):
+    """Build index ``name`` from ``load`` the first time it is queried in this process.
+
+    An index marked stale by ``request_rebuild`` is loaded again. One caller
+    loads at a time; the others wait for the first build, but keep searching
+    the stale documents during a rebuild.
+    """
+    index = indexes[name]
+    if index.built and not index.stale:
+        return index
+    if index._build_lock.acquire(blocking=not index.built):
+        try:
+            if not index.built or index.stale:
+                index.load(load())
+        finally:
+            index._build_lock.release()
+    return index
+
+
+def request_rebuild():
+    """Have every worker reload its indexes from the database when they are next queried."""
+    local_cache.bus.publish({"type": "search_rebuild"})
+
+
+def handle_message(message: dict):
+    """Apply a ``{"type": "search", "index", "id", "document"}`` message from the cache bus."""
+    if message.get("type") == "search_rebuild":
+        for index in indexes.values():
+            index.stale = True
+        return
+    if message.get("type") != "search":
+        return
+    index = indexes.get(message["index"])
+    if index is None:
+        return
+    if message.get("document") is None:
+        index.remove(message["id"])
+    else:
+        index.add(message["id"], message["document"])
+
+
+def document_changed(name: str, doc_id: int, document: Optional[dict]):
+    """Tell every worker that ``doc_id`` changed; ``document`` None means it was deleted."""
+    local_cache.bus.publish({"type": "search", "index": name, "id": doc_id, "document": document})
+
+
+def stats() -> dict:
+    return {name: index.stats() for name, index in indexes.items()}
+
+
+local_cache.subscribe(handle_message)
@@ -0,0 +1,56 @@
+from typing import Iterable, List
+
+from flask.json.provider import DefaultJSONProvider
+from pydantic import TypeAdapter
+
+import schemas
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Serializer:
+    """Row-to-dict serializer compiled once from a pydantic read schema.
+
+    Accepts ORM objects, column-only rows and plain dicts alike.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self._many = TypeAdapter(List[schema])
+
+    def one(self, obj) -> dict:
+        return self.schema.model_validate(obj, from_attributes=True).model_dump()
+
+    def many(self, objs: Iterable) -> list[dict]:
+        return self._many.dump_python(self._many.validate_python(objs, from_attributes=True))
+
+    def many_json(self, objs: Iterable) -> bytes:
+        return self._many.dump_json(self._many.validate_python(objs, from_attributes=True))
+
+
+product = Serializer(schemas.ProductRead)
+address = Serializer(schemas.AddressRead)
+order_item = Serializer(schemas.OrderItemRead)
+order = Serializer(schemas.OrderRead)
+order_summary = Serializer(schemas.OrderSummaryRead)
+order_detail = Serializer(schemas.OrderDetailRead)
+order_detail_compact = Serializer(schemas.OrderAddressRead)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def init_app(app):
+    """Switch the app to the orjson provider when orjson is installed."""
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
@@ -1,54 +1,326 @@
-from sqlalchemy.orm import Session
-from typing import Any
-
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import Integer, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+from typing import Any, Iterator, Optional
+
+import aggregates
+import cache
+import hashing
+import hot_inventory
+import local_cache
 import models
 import schemas
+import search
+import serializers
+from database import read_only
+from schemas import OrderStatus
+
+ORDER_STATUS_TRANSITIONS = {
+    OrderStatus.PENDING: {OrderStatus.COMPLETED, OrderStatus.CANCELLED},
+    OrderStatus.COMPLETED: set(),
+    OrderStatus.CANCELLED: set(),
+}
+
 
+class InvalidStatusTransition(Exception):
+    def __init__(self, current: OrderStatus, new: OrderStatus):
+        super().__init__(f"Cannot change order status from {current.value} to {new.value}")
+        self.current = current
+        self.new = new
 
+
+@read_only
 def get_all_products(db: Session) -> models.Product:
     return db.query(models.Product).order_by(models.Product.id).all()
 
 
+PRODUCT_COLUMNS = (
+    models.Product.id,
+    models.Product.name,
+    models.Product.color,
+    models.Product.weight,
+    models.Product.price,
+    models.Product.inventory,
+)
+
+
+def products_page_query(limit: int, after: Optional[int] = None):
+    """Column-only select of up to ``limit`` products with ``id > after``, ordered by id."""
+    query = select(*PRODUCT_COLUMNS).order_by(models.Product.id).limit(limit)
+    if after is not None:
+        query = query.where(models.Product.id > after)
+    return query
+
+
+@read_only
+def get_products_page(db: Session, limit: int, after: Optional[int] = None) -> list[dict]:
+    """Return up to ``limit`` products with ``id > after``, ordered by id.
+
+    Only the product columns are selected, so no ORM objects are built.
+    """
+    return [row._asdict() for row in db.execute(products_page_query(limit, after))]
+
+
+@read_only
+def iter_product_pages(db: Session, chunk_size: int = 1000) -> Iterator[list[dict]]:
+    """Yield every product in pages of ``chunk_size``, one keyset query per page."""
+    after = None
+    while True:
+        page = get_products_page(db, chunk_size, after)
+        if page:
+            yield page
+        if len(page) < chunk_size:
+            return
+        after = page[-1]["id"]
+
+
+# Ids per IN list; keeps statements well below MySQL's max_allowed_packet and placeholder limits.
+ID_CHUNK_SIZE = 1000
+
+
+def id_chunks(ids, chunk_size: int = ID_CHUNK_SIZE) -> list[list[int]]:
+    """Deduplicate ``ids`` (keeping order) and split them into chunks of at most ``chunk_size``."""
+    unique = list(dict.fromkeys(ids))
+    return [unique[start:start + chunk_size] for start in range(0, len(unique), chunk_size)]
+
+
+def products_by_ids_query(ids: list[int]):
+    return select(*PRODUCT_COLUMNS).where(models.Product.id.in_(ids))
+
+
+@read_only
+def get_products_by_ids(db: Session, ids) -> dict[int, dict]:
+    """Products for ``ids`` keyed by id, with one IN query per chunk; missing ids are absent."""
+    return {
+        row.id: row._asdict()
+        for chunk in id_chunks(ids) for row in db.execute(products_by_ids_query(chunk))
+    }
+
+
 def get_product_by_id(db: Session, product_id: int) -> models.Product:
-    return db.query(models.Product).filter(models.Product.id == product_id).first()
+    return db.get(models.Product, product_id)
+
+
+def get_cached_product(db: Session, product_id: int) -> Optional[dict]:
+    """Product snapshot from the process cache, then Redis, then MySQL."""
+    def load():
+        product = get_product_by_id(db, product_id)
+        if product is None:
+            return None
+        return {**serializers.product.one(product), "version_id": product.version_id}
+
+    return local_cache.product_cache.get_or_load(
+        product_id, lambda: cache.entity_cache.get_or_load(cache.product_key(product_id), load))
+
+
+def get_cached_products_page(db: Session, limit: int, after: Optional[int] = None) -> list[dict]:
+    return local_cache.product_page_cache.get_or_load((limit, after), lambda: get_products_page(db, limit, after))
 
 
 def product_create(db: Session, prod: schemas.ProductCreate) -> models.Product:
-    db_product = models.Product(
-        name=prod.name,
-        color=prod.color,
-        weight=prod.weight,
-        price=prod.price,
-        inventory=prod.inventory
-    )
+    db_product = models.Product(**_column_values(models.Product, prod.model_dump(
+        include={"name", "color", "weight", "price", "inventory"})))
     db.add(db_product)
     db.commit()
     db.refresh(db_product)
+    _invalidate_products(db, [db_product.id])
+    _document_changed(db, "product", db_product.id, _product_document(db_product))
     return db_product
 
 
+def _column_values(model, values: dict) -> dict:
+    """``values`` with floats meant for Integer columns rounded to int before they reach the database.
+
+    Halves round away from zero, as MySQL does when storing a decimal in an
+    integer column. Without ``RETURNING`` the values are applied to the object
+    as given, so they must already be what a reload would return; creates
+    round too, so SQLite, which keeps floats in integer columns, stores what
+    MySQL would.
+    """
+    columns = model.__table__.c
+    return {
+        key: _round(value) if isinstance(value, float) and isinstance(columns[key].type, Integer) else value
+        for key, value in values.items()
+    }
+
+
+def _round(value: float) -> int:
+    return int(Decimal(str(value)).to_integral_value(ROUND_HALF_UP))
+
+
+def _versioned_update(db: Session, model, obj, values: dict, expected_version: Optional[int] = None):
+    """Apply ``values`` to ``obj`` with a single ``UPDATE ... WHERE version_id = :expected``.
+
+    Uses ``RETURNING`` where the dialect supports it to refresh ``obj`` in the
+    same round trip; otherwise the new values are applied in memory. Raises
+    ``StaleDataError`` when another writer got there first.
+    """
+    if expected_version is None:
+        expected_version = obj.version_id
+    values = _column_values(model, values)
+    statement = (
+        update(model)
+        .where(model.id == obj.id, model.version_id == expected_version)
+        .values(**values, version_id=expected_version + 1)
+    )
+    if db.get_bind().dialect.update_returning:
+        updated = db.execute(statement.returning(model)).first() is not None
+    else:
+        updated = db.execute(statement, execution_options={"synchronize_session": "evaluate"}).rowcount == 1
+    if not updated:
+        db.rollback()
+        raise StaleDataError(f"{model.__name__} {obj.id} was modified concurrently")
+    return obj
+
+
 def product_update(
         db: Session,
         product: models.Product,
-        product_update: schemas.ProductUpdate) -> models.Product:
-    for field, value in product_update.model_dump(exclude_unset=True).items():
-        setattr(product, field, value)
-    db.commit()
-    db.refresh(product)
+        product_update: schemas.ProductUpdate,
+        expected_version: Optional[int] = None) -> models.Product:
+    values = product_update.model_dump(exclude_unset=True, exclude={"id"})
+    stock = old_stock = None
+    if "inventory" in values and hot_inventory.safe(hot_inventory.store.hot_ids, [product.id], default=set()):
+        # Hot stock lives in Redis, ahead of the row: set it there and let the flush write the row.
+        stock = values["inventory"]
+        old_stock = hot_inventory.safe(hot_inventory.store.set_stock, product.id, stock)
+        if old_stock is not None:
+            del values["inventory"]
+            if db.info.get("batch"):
+                # A rolled back batch gives back what it took, so record the change the same way.
+                db.info.setdefault("hot_reserved", []).append({product.id: old_stock - stock})
+    try:
+        _versioned_update(db, models.Product, product, values, expected_version)
+        db.commit()
+    except Exception:
+        if old_stock is not None and not db.info.get("batch"):
+            release_hot(db, {product.id: old_stock - stock})
+        raise
+    if old_stock is not None:
+        set_committed_value(product, "inventory", stock)
+    _invalidate_products(db, [product.id])
+    if {"name", "color"} & values.keys():
+        _document_changed(db, "product", product.id, _product_document(product))
     return product
 
 
 def delete_product(db: Session, product: models.Product):
+    product_id = product.id
     db.delete(product)
     db.commit()
+    _invalidate_products(db, [product_id])
+    _document_changed(db, "product", product_id, None)
+
+
+def _product_document(product) -> dict:
+    return {"name": product.name, "color": product.color}
 
 
+def _iter_product_documents(db: Session, chunk_size: int = 10000):
+    rows = db.execute(
+        select(models.Product.id, models.Product.name, models.Product.color),
+        execution_options={"yield_per": chunk_size},
+    )
+    for row in rows:
+        yield row.id, _product_document(row)
+
+
+def find_products(db: Session, query: str, limit: int, offset: int = 0) -> tuple[int, list[dict]]:
+    """Rank products matching ``query`` from the search index and load the requested page.
+
+    Returns the total number of matches and the page, in rank order.
+    """
+    index = search.ensure_built("product", lambda: _iter_product_documents(db))
+    total, ids = index.search(query, limit, offset)
+    if not ids:
+        return total, []
+    rows = {row.id: row._asdict() for row in db.execute(
+        select(*PRODUCT_COLUMNS).where(models.Product.id.in_(ids)))}
+    return total, [rows[product_id] for product_id in ids if product_id in rows]
+
+
+@read_only
 def get_addresses(db: Session) -> models.Address:
     return db.query(models.Address).order_by(models.Address.id).all()
 
 
+ADDRESS_COLUMNS = (
+    models.Address.id,
+    models.Address.country,
+    models.Address.city,
+    models.Address.street,
+)
+
+
+def addresses_filter_query(
+        street: Optional[str] = None,
+        city: Optional[str] = None,
+        country: Optional[str] = None,
+        after: Optional[int] = None,
+        limit: Optional[int] = None):
+    """Column-only address select for any combination of equality filters, ordered by id.
+
+    Every combination has an index that fixes its filters and is then ordered
+    by id, so an ``after`` page is a range read with no sort:
+    ``(country, id)``, ``(country, city, id)`` and ``(city, id)`` for filters
+    without a street, ``(country, city, street)``, ``(city, street)`` and
+    ``(street)`` for those with one, where InnoDB (and SQLite) append the
+    primary key to the index.
+    """
+    query = select(*ADDRESS_COLUMNS).order_by(models.Address.id)
+    if street:
+        query = query.where(models.Address.street == street)
+    if city:
+        query = query.where(models.Address.city == city)
+    if country:
+        query = query.where(models.Address.country == country)
+    if after is not None:
+        query = query.where(models.Address.id > after)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+@read_only
+def search_addresses(
+        db: Session,
+        street: Optional[str] = None,
+        city: Optional[str] = None,
+        country: Optional[str] = None,
+        limit: int = 100,
+        after: Optional[int] = None) -> list[dict]:
+    """Return up to ``limit`` matching addresses with ``id > after``, ordered by id."""
+    return [row._asdict() for row in db.execute(addresses_filter_query(street, city, country, after, limit))]
+
+
+def addresses_by_ids_query(ids: list[int]):
+    return select(*ADDRESS_COLUMNS).where(models.Address.id.in_(ids))
+
+
+@read_only
+def get_addresses_by_ids(db: Session, ids) -> dict[int, dict]:
+    """Addresses for ``ids`` keyed by id, with one IN query per chunk; missing ids are absent."""
+    return {
+        row.id: row._asdict()
+        for chunk in id_chunks(ids) for row in db.execute(addresses_by_ids_query(chunk))
+    }
+
+
 def get_address_by_id(db: Session, address_id: int) -> models.Address:
-    return db.query(models.Address).filter(models.Address.id == address_id).first()
+    return db.get(models.Address, address_id)
+
+
+def get_cached_address(db: Session, address_id: int) -> Optional[dict]:
+    def load():
+        address = get_address_by_id(db, address_id)
+        return None if address is None else serializers.address.one(address)
+
+    return cache.entity_cache.get_or_load(cache.address_key(address_id), load)
 
 
 def address_create(db: Session, address: schemas.AddressCreate) -> models.Address:
@@ -60,6 +332,8 @@ def address_create(db: Session, address: schemas.AddressCreate) -> models.Addres
     db.add(db_address)
     db.commit()
     db.refresh(db_address)
+    _invalidate_addresses(db, [db_address.id])
+    _document_changed(db, "address", db_address.id, _address_document(db_address))
     return db_address
 
 
@@ -69,102 +343,563 @@ def address_update(
     for field, value in address_update.model_dump(exclude_unset=True).items():
         setattr(address, field, value)
     db.commit()
-    db.refresh(address)
+    _invalidate_addresses(db, [address.id])
+    _document_changed(db, "address", address.id, _address_document(address))
     return address
 
 
 def delete_address(db: Session, address: models.Address):
+    address_id = address.id
     db.delete(address)
     db.commit()
+    _invalidate_addresses(db, [address_id])
+    _document_changed(db, "address", address_id, None)
 
 
-def get_orders(db: Session) -> models.Order:
-    return db.query(models.Order).all()
+def _address_document(address) -> dict:
+    return {"street": address.street, "city": address.city, "country": address.country}
 
 
-def get_order_by_id(db: Session, order_id: int) -> models.Order:
-    return db.query(models.Order).filter(models.Order.id == order_id).first()
+def _iter_address_documents(db: Session, chunk_size: int = 10000):
+    rows = db.execute(
+        select(models.Address.id, models.Address.street, models.Address.city, models.Address.country),
+        execution_options={"yield_per": chunk_size},
+    )
+    for row in rows:
+        yield row.id, _address_document(row)
+
+
+def find_addresses(db: Session, query: str, limit: int, offset: int = 0) -> tuple[int, list[models.Address]]:
+    """Rank addresses matching ``query`` from the search index and load the requested page."""
+    index = search.ensure_built("address", lambda: _iter_address_documents(db))
+    total, ids = index.search(query, limit, offset)
+    if not ids:
+        return total, []
+    addresses = {address.id: address for address in db.scalars(
+        select(models.Address).where(models.Address.id.in_(ids)))}
+    return total, [addresses[address_id] for address_id in ids if address_id in addresses]
+
+
+def order_loader_options(with_items: bool = True, with_address: bool = False) -> list:
+    """Explicit loaders: one extra IN query for items, a JOIN for the address."""
+    options = []
+    if with_items:
+        options.append(selectinload(models.Order.productitems))
+    if with_address:
+        options.append(joinedload(models.Order.address))
+    return options
+
+
+def order_query(with_items: bool = True, with_address: bool = False):
+    return select(models.Order).options(*order_loader_options(with_items, with_address))
+
+
+def orders_query(
+        status: Optional[str] = None,
+        address_id: Optional[int] = None,
+        min_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        descending: bool = False):
+    """Orders matching the filters, keyset-paginated on ``Order.id``.
+
+    ``after`` is the last id of the previous page; with ``descending`` pages walk
+    towards smaller ids. Status and address filters are served by the
+    ``(status, id)`` and ``(address_id, id)`` indexes.
+    """
+    query = order_query()
+    if status is not None:
+        query = query.where(models.Order.status == status)
+    if address_id is not None:
+        query = query.where(models.Order.address_id == address_id)
+    if min_id is not None:
+        query = query.where(models.Order.id >= min_id)
+    if max_id is not None:
+        query = query.where(models.Order.id <= max_id)
+    if after is not None:
+        query = query.where(models.Order.id < after if descending else models.Order.id > after)
+    query = query.order_by(models.Order.id.desc() if descending else models.Order.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+@read_only
+def get_orders(db: Session, **filters) -> list[models.Order]:
+    """List orders; see ``orders_query`` for the accepted filters."""
+    return db.scalars(orders_query(**filters)).all()
+
+
+def get_order_by_id(
+        db: Session, order_id: int,
+        with_items: bool = True, with_address: bool = False,
+        refresh: bool = False) -> models.Order:
+    """Order by primary key; served from the session's identity map when already loaded."""
+    return db.get(
+        models.Order, order_id,
+        options=order_loader_options(with_items, with_address),
+        populate_existing=refresh,
+    )
 
 
+@read_only
 def get_order_status_by_id(db: Session, order_id: int) -> dict[str: Any]:
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if order is None:
+    status = db.scalar(select(models.Order.status).where(models.Order.id == order_id))
+    if status is None:
         return {"error": "Order not found"}, 404
-    return {"status": order.status}
+    return {"status": status}
 
 
-def create_order(db: Session, order: schemas.OrderCreate) -> models.Order:
+def _lock_products(db: Session, product_ids) -> dict:
+    """Lock the given products with one ``SELECT ... FOR UPDATE`` and return their inventory and price rows.
 
-    order_data = order.model_dump()
-    product_items_data = order_data.pop("productitems")
+    Rows are locked in id order so concurrent orders cannot deadlock each other.
+    """
+    rows = db.execute(
+        select(models.Product.id, models.Product.inventory, models.Product.price, models.Product.version_id)
+        .where(models.Product.id.in_(sorted(product_ids)))
+        .order_by(models.Product.id)
+        .with_for_update()
+    )
+    return {row.id: row for row in rows}
 
-    order_db = models.Order(**order_data)
-    db.add(order_db)
 
+def _write_inventory(db: Session, locked: dict, inventory: dict[int, int]):
+    """Bulk UPDATE by primary key of the locked products whose inventory changed."""
+    changed = [
+        {"id": product_id, "inventory": value, "version_id": locked[product_id].version_id}
+        for product_id, value in inventory.items() if value != locked[product_id].inventory
+    ]
+    if changed:
+        db.execute(update(models.Product), changed)
+
+
+def _invalidate_products(db: Session, product_ids):
+    """Drop changed products from the caches and move their ETags on; a running batch does it once it ends."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    if db.info.get("batch"):
+        db.info.setdefault("invalidated", []).append(("product", product_ids))
+        return
+    cache.entity_cache.invalidate(*[cache.product_key(product_id) for product_id in product_ids])
+    local_cache.invalidate("product", *product_ids)
+    local_cache.invalidate("product_pages")
+    cache.versions.bump("product", *product_ids)
+
+
+def _invalidate_addresses(db: Session, address_ids):
+    address_ids = list(address_ids)
+    if db.info.get("batch"):
+        db.info.setdefault("invalidated", []).append(("address", address_ids))
+        return
+    cache.entity_cache.invalidate(*[cache.address_key(address_id) for address_id in address_ids])
+    cache.versions.bump("address", *address_ids)
+
+
+def invalidate(db: Session, table: str, row_ids):
+    """Invalidate rows a batch changed, once the batch has ended."""
+    {"product": _invalidate_products, "address": _invalidate_addresses}[table](db, row_ids)
+
+
+def _document_changed(db: Session, kind: str, doc_id: int, document):
+    """Update the search index; a running batch does it once it commits."""
+    if db.info.get("batch"):
+        db.info.setdefault("documents", []).append((kind, doc_id, document))
+    else:
+        search.document_changed(kind, doc_id, document)
+
+
+def _item_quantities(product_items_data: list[dict]) -> dict[int, int]:
+    quantities = defaultdict(int)
     for item in product_items_data:
-        product_id = item.get("product_id")
-        quantity = item.get("quantity")
-        product = db.query(models.Product).get(product_id)
+        quantities[item["product_id"]] += item["quantity"]
+    return quantities
 
-        if product is None:
-            db.rollback()
-            return None
 
-        if product.inventory < quantity:
-            db.rollback()
-            return None
-        product.inventory -= quantity
-        order_item_db = models.OrderItem(**item, order_id=order_db.id)
-        db.add(order_item_db)
+def _product_prices(db: Session, product_ids) -> dict:
+    """Price rows of products whose stock is not taken from the locked rows."""
+    rows = db.execute(
+        select(models.Product.id, models.Product.price).where(models.Product.id.in_(list(product_ids))))
+    return {row.id: row for row in rows}
 
-    db.commit()
+
+def _split_hot(quantities: dict[int, int]) -> tuple[dict[int, int], dict[int, int]]:
+    """Split ``quantities`` into the products held in Redis and the ones held in the database."""
+    hot = hot_inventory.safe(hot_inventory.store.hot_ids, quantities, default=set())
+    return (
+        {product_id: quantity for product_id, quantity in quantities.items() if product_id in hot},
+        {product_id: quantity for product_id, quantity in quantities.items() if product_id not in hot},
+    )
+
+
+def _reserve_hot(db: Session, quantities: dict[int, int]) -> bool:
+    """Take hot stock in Redis; a running batch gives it back if it rolls back."""
+    if not quantities:
+        return True
+    if not hot_inventory.safe(hot_inventory.store.reserve, quantities, default=False):
+        return False
+    if db.info.get("batch"):
+        db.info.setdefault("hot_reserved", []).append(quantities)
+    return True
+
+
+def release_hot(db: Session, quantities: dict[int, int]):
+    """Give hot stock back; products that stopped being hot meanwhile are restored in the database."""
+    if not quantities:
+        return
+    cold = hot_inventory.safe(hot_inventory.store.release, quantities, default=set(quantities))
+    if cold:
+        _restore_inventory(db, {product_id: quantities[product_id] for product_id in cold})
+        db.commit()
+        _invalidate_products(db, cold)
+
+
+def _count_hot(db: Session, delta: aggregates.SalesDelta):
+    """Leave the counter changes of an order with hot products to the next hot flush.
+
+    Writing them in the order transaction would make every such order queue
+    on the ``order_status_count`` and ``product_sales`` rows again. A running
+    batch hands them over once it commits.
+    """
+    if db.info.get("batch"):
+        db.info.setdefault("hot_counters", []).append(delta)
+    else:
+        record_hot_counters(db, delta)
+
+
+def record_hot_counters(db: Session, delta: aggregates.SalesDelta):
+    """Queue counter changes for the hot flush, or write them now when Redis is unreachable."""
+    fields = hot_inventory.counter_fields(delta)
+    if fields and not hot_inventory.safe(hot_inventory.store.count, fields, default=False):
+        delta.apply(db)
+        db.commit()
+
+
+def _reserve_inventory(db: Session, quantities: dict[int, int]) -> Optional[tuple[dict, dict[int, int]]]:
+    """Take ``quantities`` out of stock.
+
+    Products held in the database are locked and updated; hot products are
+    reserved in Redis once the others are known to be in stock. Returns the
+    price rows of every product and the hot quantities reserved, or None
+    when something is missing or short.
+    """
+    hot, cold = _split_hot(quantities)
+    locked = _lock_products(db, cold) if cold else {}
+    if len(locked) != len(cold):
+        return None
+    if any(locked[product_id].inventory < quantity for product_id, quantity in cold.items()):
+        return None
+    prices = _product_prices(db, hot) if hot else {}
+    if len(prices) != len(hot) or not _reserve_hot(db, hot):
+        return None
+
+    _write_inventory(db, locked, {
+        product_id: locked[product_id].inventory - quantity for product_id, quantity in cold.items()
+    })
+    return {**locked, **prices}, hot
+
+
+def enable_hot_product(db: Session, product_id: int) -> bool:
+    """Move a product's stock to Redis; False when the product does not exist."""
+    flushed = hot_inventory.enable(db, product_id)
+    if flushed is None:
+        return False
+    _invalidate_products(db, flushed)
+    return True
+
+
+def disable_hot_product(db: Session, product_id: int):
+    """Move a product's stock back to the database."""
+    _invalidate_products(db, hot_inventory.disable(db, product_id))
+
+
+def flush_hot_inventory(db: Session) -> list[int]:
+    """Write pending hot stock changes to the database and drop the products from the caches."""
+    flushed = hot_inventory.flush(db)
+    _invalidate_products(db, flushed)
+    return flushed
+
+
+def _record_sales(delta: aggregates.SalesDelta, status, quantities: dict[int, int], prices: dict):
+    """Count the units and revenue of an order in ``status``; cancelled orders do not count."""
+    if status != OrderStatus.CANCELLED:
+        for product_id, quantity in quantities.items():
+            delta.sale(product_id, quantity, prices[product_id].price)
+
+
+def create_order(db: Session, order: schemas.OrderCreate) -> models.Order:
+
+    order_data = order.model_dump()
+    product_items_data = order_data.pop("productitems")
+    quantities = _item_quantities(product_items_data)
+
+    reserved = _reserve_inventory(db, quantities)
+    if reserved is None:
+        db.rollback()
+        return None
+    prices, hot = reserved
+
+    try:
+        order_db = models.Order(**order_data)
+        order_db.productitems = [
+            models.OrderItem(**item, price=prices[item["product_id"]].price) for item in product_items_data
+        ]
+        db.add(order_db)
+
+        delta = aggregates.SalesDelta()
+        delta.order(order_db.status)
+        _record_sales(delta, order_db.status, quantities, prices)
+        if not hot:
+            delta.apply(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        if not db.info.get("batch"):
+            release_hot(db, hot)
+        raise
+    if hot:
+        _count_hot(db, delta)
+    _invalidate_products(db, [product_id for product_id in quantities if product_id not in hot])
     db.refresh(order_db)
 
     return order_db
 
 
+def create_orders_bulk(db: Session, orders: list[schemas.OrderCreate]) -> list[dict]:
+    """Create a batch of orders in one transaction and report the outcome per order.
+
+    Inventory for the whole batch is locked with a single query and orders are
+    accepted in sequence while stock lasts. Accepted orders, their items and the
+    inventory changes are written with one executemany statement each.
+    """
+    orders_data = [order.model_dump() for order in orders]
+    order_ids = [order_data["id"] for order_data in orders_data]
+    address_ids = {order_data["address_id"] for order_data in orders_data}
+    product_ids = {item["product_id"] for order_data in orders_data for item in order_data["productitems"]}
+
+    existing_ids = set(db.scalars(select(models.Order.id).where(models.Order.id.in_(order_ids))))
+    known_addresses = set(db.scalars(select(models.Address.id).where(models.Address.id.in_(address_ids))))
+    hot_ids = hot_inventory.safe(hot_inventory.store.hot_ids, product_ids, default=set())
+    locked = _lock_products(db, product_ids - hot_ids)
+    prices = {**locked, **(_product_prices(db, hot_ids) if hot_ids else {})}
+    remaining = {product_id: row.inventory for product_id, row in locked.items()}
+    reserved = []
+
+    report = []
+    order_rows = []
+    item_rows = []
+    delta = aggregates.SalesDelta()
+    for index, order_data in enumerate(orders_data):
+        product_items_data = order_data.pop("productitems")
+        quantities = _item_quantities(product_items_data)
+
+        error = None
+        if order_data["id"] in existing_ids:
+            error = "Order already exists"
+        elif order_data["address_id"] not in known_addresses:
+            error = "Address not found"
+        elif any(product_id not in prices for product_id in quantities):
+            error = "Product not found"
+        elif any(remaining[product_id] < quantity for product_id, quantity in quantities.items()
+                 if product_id in remaining):
+            error = "Insufficient inventory"
+        else:
+            hot = {product_id: quantity for product_id, quantity in quantities.items() if product_id in hot_ids}
+            if not _reserve_hot(db, hot):
+                error = "Insufficient inventory"
+            elif hot:
+                reserved.append(hot)
+
+        if error is not None:
+            report.append({"index": index, "id": order_data["id"], "success": False, "error": error})
+            continue
+
+        for product_id, quantity in quantities.items():
+            if product_id in remaining:
+                remaining[product_id] -= quantity
+        existing_ids.add(order_data["id"])
+        delta.order(order_data["status"])
+        _record_sales(delta, order_data["status"], quantities, prices)
+        order_rows.append(order_data)
+        item_rows.extend(
+            {**item, "order_id": order_data["id"], "price": prices[item["product_id"]].price}
+            for item in product_items_data
+        )
+        report.append({"index": index, "id": order_data["id"], "success": True})
+
+    try:
+        if order_rows:
+            db.execute(insert(models.Order), order_rows)
+            if item_rows:
+                db.execute(insert(models.OrderItem), item_rows)
+            _write_inventory(db, locked, remaining)
+            if not reserved:
+                delta.apply(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        if not db.info.get("batch"):
+            for hot in reserved:
+                release_hot(db, hot)
+        raise
+    if reserved:
+        _count_hot(db, delta)
+    _invalidate_products(db, [
+        product_id for product_id in remaining if remaining[product_id] != locked[product_id].inventory
+    ])
+
+    return report
+
+
+def _order_items(db: Session, order_id: int) -> list:
+    return db.execute(
+        select(models.OrderItem.product_id, models.OrderItem.quantity, models.OrderItem.price)
+        .where(models.OrderItem.order_id == order_id)
+    ).all()
+
+
+def _reverse_item_sales(delta: aggregates.SalesDelta, status, items):
+    """Take back the units and revenue of ``items`` at the prices they were sold for."""
+    if status != OrderStatus.CANCELLED:
+        for item in items:
+            if item.product_id is not None:
+                delta.sale(item.product_id, item.quantity, item.price or 0, sign=-1)
+
+
+def _restore_inventory(db: Session, quantities: dict[int, int]) -> dict:
+    """Put the items of a cancelled order back in stock with one bulk UPDATE; returns the locked rows."""
+    locked = _lock_products(db, quantities)
+    _write_inventory(db, locked, {
+        product_id: row.inventory + quantities[product_id] for product_id, row in locked.items()
+    })
+    return locked
+
+
 def update_order_status(
         db: Session,
-        order: models.Order,
-        order_update: schemas.OrderUpdate) -> dict:
+        order_id: int,
+        order_update: schemas.OrderUpdate,
+        expected_version: Optional[int] = None) -> Optional[models.Order]:
+    """Move an order to a new status with a conditional UPDATE.
+
+    The UPDATE only matches while the order is in a status the transition
+    table allows to move to the new one, so the order is not loaded first.
+    It is issued once per allowed source status (a single statement for the
+    current table) so the counters know which status the order left.
+    Returns None when the order does not exist, raises
+    ``InvalidStatusTransition`` when the move is not allowed and
+    ``StaleDataError`` when ``expected_version`` no longer matches.
+    """
     if isinstance(order_update, dict):
         order_update = schemas.OrderUpdate(**order_update)
+    new_status = order_update.status
+    allowed = [status for status, targets in ORDER_STATUS_TRANSITIONS.items() if new_status in targets]
+
+    order = None
+    for old_status in allowed:
+        statement = (
+            update(models.Order)
+            .where(models.Order.id == order_id, models.Order.status == old_status)
+            .values(status=new_status, version_id=models.Order.version_id + 1)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        if expected_version is not None:
+            statement = statement.where(models.Order.version_id == expected_version)
+
+        if db.get_bind().dialect.update_returning:
+            order = db.scalar(statement.returning(models.Order))
+        else:
+            order = get_order_by_id(db, order_id, refresh=True) if db.execute(statement).rowcount == 1 else None
+        if order is not None:
+            break
 
-    order_data = order_update.dict(exclude={"productitems"})
-    for key, value in order_data.items():
-        setattr(order, key, value)
-
+    if order is None:
+        db.rollback()
+        current = db.execute(
+            select(models.Order.status, models.Order.version_id).where(models.Order.id == order_id)
+        ).first()
+        if current is None:
+            return None
+        if expected_version is not None and current.version_id != expected_version:
+            raise StaleDataError(f"Order {order_id} was modified concurrently")
+        raise InvalidStatusTransition(current.status, new_status)
+
+    delta = aggregates.SalesDelta()
+    delta.order(old_status, -1)
+    delta.order(new_status)
+    restored = {}
+    hot = {}
+    if new_status == OrderStatus.CANCELLED:
+        items = _order_items(db, order_id)
+        hot, cold = _split_hot(_item_quantities([item._asdict() for item in items]))
+        restored = _restore_inventory(db, cold) if cold else {}
+        _reverse_item_sales(delta, old_status, items)
+    if not hot:
+        delta.apply(db)
     db.commit()
-    db.refresh(order)
+    _invalidate_products(db, restored)
+    if hot:
+        _count_hot(db, delta)
+    if hot and db.info.get("batch"):
+        db.info.setdefault("hot_released", []).append(hot)
+    else:
+        release_hot(db, hot)
     return order
 
 
 def delete_order(db: Session, order: models.Order):
+    delta = aggregates.SalesDelta()
+    delta.order(order.status, -1)
+    _reverse_item_sales(delta, order.status, order.productitems)
     db.delete(order)
+    delta.apply(db)
     db.commit()
 
 
-def get_order_by_status(db: Session, status: str) -> models.Order:
-    return db.query(models.Order).filter(models.Order.status == status).all()
+@read_only
+def get_order_by_status(db: Session, status: str, with_items: bool = True) -> models.Order:
+    return db.scalars(order_query(with_items).where(models.Order.status == status)).all()
 
 
 def get_user_by_username(db: Session, username: str) -> models.User:
     return db.query(models.User).filter(models.User.username == username).first()
 
 
-def create_user(db: Session, user: schemas.UserCreate) -> models.Order:
+def get_cached_user(db: Session, username: str) -> Optional[dict]:
+    """``{"id", "username", "is_admin"}`` for ``username``, kept briefly in the process cache."""
+    def load():
+        row = db.execute(
+            select(models.User.id, models.User.username, models.User.is_admin)
+            .where(models.User.username == username)
+        ).first()
+        return None if row is None else row._asdict()
+
+    return local_cache.user_cache.get_or_load(username, load)
+
+
+def create_user(db: Session, user: schemas.UserCreate) -> Optional[models.User]:
+    """Create a user; returns None when the username is taken."""
+    if db.scalar(select(models.User.id).where(models.User.username == user.username)) is not None:
+        return None
     new_user = models.User(
         username=user.username,
         password=user.password,
     )
-    db.session.add(new_user)
-    db.session.commit()
-    db.session.refresh(new_user)
+    db.add(new_user)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(new_user)
     return new_user
 
 
 def update_user(db: Session, user: models.User, user_update: schemas.UserUpdate) -> models.User:
-    update_data = user_update.dict(exclude_unset=True)
+    update_data = user_update.model_dump(exclude_unset=True)
+    old_username = user.username
 
     if 'password' in update_data:
         user.set_password(update_data.pop('password').get_secret_value())
@@ -173,19 +908,28 @@ def update_user(db: Session, user: models.User, user_update: schemas.UserUpdate)
         setattr(user, field, value)
 
     db.commit()
-    db.refresh(user)
+    local_cache.invalidate("user", old_username)
     return user
 
-def authenticate(db: Session, username, password):
-    db_user = db.query(models.User).filter_by(username=username).first()
-    if db_user and db_user.check_password(password):
-        return db_user
-    return None
+
+def authenticate(db: Session, username, password) -> Optional[models.User]:
+    """Check ``password`` and upgrade the stored hash when the hashing method or cost changed."""
+    db_user = get_user_by_username(db, username)
+    if db_user is None:
+        return hashing.verify_dummy(password) or None
+    if not db_user.check_password(password):
+        return None
+    if hashing.needs_rehash(db_user.password_hash):
+        db_user.set_password(password)
+        db.commit()
+    return db_user
 
 
 def delete_user(db: Session, user: models.User):
+    username = user.username
     db.delete(user)
     db.commit()
+    local_cache.invalidate("user", username)
 
 
 
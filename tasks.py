@@ -1,17 +1,53 @@
-import os
+import redis
+from celery.signals import worker_init, worker_process_shutdown, worker_shutdown
 
-from celery_ import app
-from datetime import datetime
+import cache
+import hot_inventory
+import local_cache
+import services
+from celery_ import app, broker_url
+from database import SessionLocal
+from events import make_event, order_events
 
 
-@app.task
+@app.task(ignore_result=True)
 def track_order_status(order_id, new_status):
-    try:
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        project_root = os.path.abspath(os.path.dirname(__file__))
-        file_path = os.path.join(project_root, 'order_events.txt')
-
-        with open(file_path, "a") as file:
-            file.write(f'Order {order_id} change status on {new_status["status"]} at {current_time}\n')
-    except Exception as e:
-        print(f"Error while writing to file: {e}")
\ No newline at end of file
+    event = make_event(order_id, new_status["status"])
+    if "at" in new_status:
+        event["at"] = new_status["at"]
+    order_events.add(event)
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_order_events(**kwargs):
+    """Write the buffered events before exiting.
+
+    Pool processes buffer their own events and only see ``worker_process_shutdown``;
+    with ``-P solo`` the tasks run in the main process, which sees ``worker_shutdown``.
+    """
+    order_events.flush()
+
+
+@worker_init.connect
+def use_redis(**kwargs):
+    """Share hot stock, caches and versions with the web workers, so flushes invalidate what they serve."""
+    client = redis.StrictRedis.from_url(broker_url)
+    hot_inventory.use_client(client)
+    cache.entity_cache.client = client
+    cache.versions.client = client
+    local_cache.use_bus(local_cache.RedisBus(client))
+
+
+@app.task(ignore_result=True)
+def flush_hot_inventory():
+    with SessionLocal() as db:
+        services.flush_hot_inventory(db)
+
+
+@app.task(ignore_result=True)
+def reconcile_hot_inventory(repair=False):
+    with SessionLocal() as db:
+        drift = hot_inventory.reconcile(db, repair=repair)
+    if drift:
+        print(f"Hot inventory drift{' (repaired)' if repair else ''}: {drift}")
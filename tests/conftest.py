@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event, insert
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+# Point the app at a SQLite stand-in before anything imports ``database``.
+DATA_DIR = tempfile.mkdtemp(prefix="products-tests-")
+os.environ["DATABASE_URI"] = f"sqlite:///{os.path.join(DATA_DIR, 'primary.db')}"
+os.environ["DATABASE_REPLICA_URIS"] = ""
+os.environ["ORDER_EVENTS_PATH"] = os.path.join(DATA_DIR, "order_events.jsonl")
+
+import cache  # noqa: E402
+import database  # noqa: E402
+import hot_inventory  # noqa: E402
+import http_cache  # noqa: E402
+import idempotency  # noqa: E402
+import local_cache  # noqa: E402
+import models  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    import app as app_module
+
+    # Tests never share a Redis that happens to run on this machine.
+    cache.entity_cache.client = None
+    cache.versions.client = None
+    http_cache.responses.client = None
+    idempotency.store.client = None
+    hot_inventory.use_client(None)
+    local_cache.use_bus(local_cache.LocalBus())
+    return app_module.app
+
+
+@pytest.fixture(autouse=True)
+def clean_database():
+    models.Base.metadata.drop_all(database.engine)
+    models.Base.metadata.create_all(database.engine)
+    for local in local_cache.caches.values():
+        local.clear()
+    yield
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def replica_engine(monkeypatch):
+    """A second SQLite file that serves every read-only call."""
+    path = os.path.join(DATA_DIR, "replica.db")
+    engine = database.create_db_engine(f"sqlite:///{path}")
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    # The replica holds a different copy of product 1, so each read shows where it went.
+    with engine.begin() as connection:
+        connection.execute(insert(models.Product), [
+            {"id": 1, "name": "replica copy", "color": "red", "weight": 1, "price": 10, "inventory": 100}])
+    monkeypatch.setattr(database, "replicas", database.ReplicaPool([engine]))
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def statements():
+    """SQL statements run on the primary engine while the test runs, without BEGINs."""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("BEGIN"):
+            executed.append(statement)
+
+    event.listen(database.engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(database.engine, "before_cursor_execute", record)
+
+
+def make_product(client, product_id, **fields):
+    product = {"id": product_id, "name": f"product {product_id}", "color": "red",
+               "weight": 1, "price": 10, "inventory": 100, **fields}
+    assert client.post("/products/", json=product).status_code == 200
+    return product
+
+
+def make_address(client, address_id, **fields):
+    address = {"id": address_id, "country": "UA", "city": "Kyiv", "street": f"Street {address_id}", **fields}
+    assert client.post("/addresses/", json=address).status_code == 200
+    return address
+
+
+def make_order(client, order_id, address_id, items):
+    order = {"id": order_id, "address_id": address_id,
+             "productitems": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in items]}
+    assert client.post("/orders/", json=order).status_code == 201
+    return order
@@ -0,0 +1,45 @@
+"""Address filters are answered from the composite indexes, checked with EXPLAIN on SQLite."""
+import pytest
+from sqlalchemy import insert, text
+
+import database
+import models
+import services
+
+
+def query_plan(query) -> str:
+    sql = query.compile(database.engine, compile_kwargs={"literal_binds": True})
+    with database.engine.connect() as connection:
+        return " ".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+@pytest.fixture(autouse=True)
+def addresses():
+    rows = [
+        {"id": i, "country": f"country {i % 20}", "city": f"city {i % 200}", "street": f"street {i % 2000}"}
+        for i in range(1, 5001)
+    ]
+    with database.engine.begin() as connection:
+        connection.execute(insert(models.Address), rows)
+        connection.execute(text("ANALYZE"))
+
+
+@pytest.mark.parametrize("filters, index", [
+    ({"country": "country 1"}, "ix_address_country_id"),
+    ({"country": "country 1", "city": "city 1"}, "ix_address_country_city_id"),
+    ({"country": "country 1", "city": "city 1", "street": "street 1"}, "ix_address_country_city_street"),
+    ({"city": "city 1"}, "ix_address_city_id"),
+    ({"city": "city 1", "street": "street 1"}, "ix_address_city_street"),
+    ({"street": "street 1"}, "ix_address_street"),
+])
+@pytest.mark.parametrize("after", [None, 2500])
+def test_filters_use_an_index_in_id_order(filters, index, after):
+    plan = query_plan(services.addresses_filter_query(**filters, after=after, limit=100))
+    assert index in plan
+    assert "SCAN" not in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_unfiltered_pages_walk_the_primary_key():
+    plan = query_plan(services.addresses_filter_query(after=100, limit=100))
+    assert "INTEGER PRIMARY KEY" in plan
@@ -0,0 +1,96 @@
+"""Read-through cache behaviour against fakeredis."""
+import json
+import threading
+import time
+
+import pytest
+
+import cache
+import local_cache
+from conftest import make_address, make_product
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(cache.entity_cache, "client", client)
+    return client
+
+
+def test_loads_once_then_serves_from_redis(redis_client):
+    store = cache.ReadThroughCache(redis_client)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return {"id": 1}
+
+    assert store.get_or_load("product:1", load) == {"id": 1}
+    assert store.get_or_load("product:1", load) == {"id": 1}
+    assert len(calls) == 1
+    assert redis_client.ttl("product:1") == cache.CACHE_TTL
+
+
+def test_misses_are_not_cached(redis_client):
+    store = cache.ReadThroughCache(redis_client)
+    assert store.get_or_load("product:1", lambda: None) is None
+    assert not redis_client.exists("product:1")
+
+
+def test_cold_key_is_loaded_by_one_caller(redis_client):
+    store = cache.ReadThroughCache(redis_client, poll_interval=0.005)
+    calls = []
+    results = []
+
+    def load():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"id": 1}
+
+    threads = [threading.Thread(target=lambda: results.append(store.get_or_load("product:1", load)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"id": 1}] * 8
+
+
+def test_load_racing_an_invalidation_is_not_stored(redis_client):
+    pytest.importorskip("lupa")
+    store = cache.ReadThroughCache(redis_client)
+
+    def load_old():
+        # A write commits and invalidates while the old row is being loaded.
+        store.invalidate("product:1")
+        return {"name": "old"}
+
+    assert store.get_or_load("product:1", load_old) == {"name": "old"}
+    assert not redis_client.exists("product:1")
+    assert store.get_or_load("product:1", lambda: {"name": "new"}) == {"name": "new"}
+    assert json.loads(redis_client.get("product:1")) == {"name": "new"}
+
+
+def test_product_update_invalidates(client, redis_client):
+    product = make_product(client, 1)
+    assert client.get("/products/1/").get_json()["name"] == "product 1"
+    assert redis_client.exists(cache.product_key(1))
+
+    assert client.put("/products/1/", json={**product, "name": "renamed"}).status_code == 200
+    assert not redis_client.exists(cache.product_key(1))
+    local_cache.product_cache.clear()
+    assert client.get("/products/1/").get_json()["name"] == "renamed"
+
+
+def test_address_delete_invalidates(client, redis_client):
+    make_address(client, 1)
+    assert client.get("/addresses/1/").status_code == 200
+    assert redis_client.exists(cache.address_key(1))
+
+    assert client.delete("/addresses/1/").status_code == 204
+    assert not redis_client.exists(cache.address_key(1))
+    assert client.get("/addresses/1/").status_code == 404
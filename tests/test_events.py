@@ -0,0 +1,20 @@
+"""Order event batching."""
+from celery.signals import worker_process_shutdown, worker_shutdown
+
+import events
+import tasks
+
+
+def test_worker_shutdown_signals_flush_buffered_events(tmp_path, monkeypatch):
+    batcher = events.EventBatcher(str(tmp_path / "events.jsonl"), batch_size=100, flush_interval=60)
+    monkeypatch.setattr(tasks, "order_events", batcher)
+
+    tasks.track_order_status(1, {"status": "completed"})
+    assert not (tmp_path / "events.jsonl").exists()
+    worker_process_shutdown.send(sender=None, pid=1, exitcode=0)
+    assert [event["order_id"] for event in events.replay(batcher.path)] == [1]
+
+    tasks.track_order_status(2, {"status": "cancelled", "at": "2024-01-01T00:00:00+00:00"})
+    worker_shutdown.send(sender=None)
+    assert list(events.replay(batcher.path))[1] == {
+        "order_id": 2, "status": "cancelled", "at": "2024-01-01T00:00:00+00:00"}
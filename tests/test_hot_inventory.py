@@ -0,0 +1,124 @@
+"""Hot product stock held in the in-process store and in Redis (fakeredis with Lua)."""
+import pytest
+from sqlalchemy import update
+from sqlalchemy.exc import OperationalError
+
+import aggregates
+import hot_inventory
+import models
+import services
+from conftest import make_address, make_order, make_product
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, flask_app):
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        hot_inventory.use_client(fakeredis.FakeStrictRedis())
+    else:
+        hot_inventory.use_client(None)
+    yield hot_inventory.store
+    hot_inventory.use_client(None)
+
+
+@pytest.fixture
+def hot_product(client, store):
+    make_address(client, 1)
+    product = make_product(client, 1, inventory=100)
+    assert client.put("/internal/hot-products/1/").status_code == 200
+    return product
+
+
+def stock(store, product_id=1):
+    return store.snapshot([product_id])[0][product_id]
+
+
+def test_inventory_update_sets_the_hot_stock(client, db, store, hot_product):
+    make_order(client, 1, 1, [(1, 5)])
+    services.flush_hot_inventory(db)
+    assert client.put("/orders/1/status/", json={"status": "cancelled"}).status_code == 200
+    assert stock(store) == 100
+
+    response = client.put("/products/1/", json={**hot_product, "inventory": 50})
+    assert response.status_code == 200
+    assert response.get_json()["inventory"] == 50
+    assert stock(store) == 50
+
+    services.flush_hot_inventory(db)
+    db.expire_all()
+    assert services.get_product_by_id(db, 1).inventory == 50
+    assert hot_inventory.reconcile(db) == {}
+
+
+def test_rolled_back_batch_restores_the_hot_stock(client, store, hot_product):
+    calls = [
+        {"jsonrpc": "2.0", "id": 1, "method": "products.update",
+         "params": {"id": 1, "product": {**hot_product, "inventory": 30}}},
+        {"jsonrpc": "2.0", "id": 2, "method": "orders.create",
+         "params": {"order": {"id": 1, "address_id": 1, "productitems": [{"product_id": 99, "quantity": 1}]}}},
+    ]
+    client.post("/json-rpc", json=calls)
+    assert stock(store) == 100
+
+
+def test_failed_flush_keeps_the_batch_for_retry(client, db, store, hot_product, monkeypatch):
+    make_order(client, 1, 1, [(1, 5)])
+
+    def fail(self, db):
+        raise OperationalError("UPDATE product_stats", {}, Exception("lock wait timeout"))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(aggregates.SalesDelta, "apply", fail)
+        with pytest.raises(OperationalError):
+            services.flush_hot_inventory(db)
+    assert len(store.batches()) == 1
+    db.expire_all()
+    assert services.get_product_by_id(db, 1).inventory == 100
+
+    assert services.flush_hot_inventory(db) == [1]
+    assert store.batches() == []
+    db.expire_all()
+    assert services.get_product_by_id(db, 1).inventory == 95
+
+
+def test_orders_beyond_the_hot_stock_are_rejected(client, store, hot_product):
+    make_product(client, 2, inventory=5)
+    assert client.put("/internal/hot-products/2/").status_code == 200
+
+    order = {"id": 1, "address_id": 1, "productitems": [{"product_id": 1, "quantity": 1},
+                                                        {"product_id": 2, "quantity": 6}]}
+    assert client.post("/orders/", json=order).status_code == 409
+    assert (stock(store, 1), stock(store, 2)) == (100, 5)
+
+    make_order(client, 1, 1, [(1, 100)])
+    assert stock(store) == 0
+    order = {"id": 2, "address_id": 1, "productitems": [{"product_id": 1, "quantity": 1}]}
+    assert client.post("/orders/", json=order).status_code == 409
+    assert stock(store) == 0
+
+
+def test_batch_applied_before_a_crash_is_not_applied_again(client, db, store, hot_product):
+    make_order(client, 1, 1, [(1, 5)])
+    store.seal()
+    [(batch_id, fields)] = store.batches()
+    # The first flush committed, then died before dropping the batch from the store.
+    assert hot_inventory._apply_batch(db, batch_id, *hot_inventory.split_fields(fields))
+
+    assert services.flush_hot_inventory(db) == [1]
+    assert store.batches() == []
+    db.expire_all()
+    assert services.get_product_by_id(db, 1).inventory == 95
+    assert hot_inventory.reconcile(db) == {}
+
+
+def test_reconcile_repairs_drifted_stock(db, store, hot_product):
+    # A cold path write that raced the product being flagged hot.
+    db.execute(update(models.Product).where(models.Product.id == 1).values(inventory=90))
+    db.commit()
+
+    assert hot_inventory.reconcile(db) == {1: {"stock": 100, "inventory": 90, "pending": 0, "drift": 10}}
+    assert stock(store) == 100
+    assert hot_inventory.reconcile(db, repair=True)[1]["drift"] == 10
+    assert stock(store) == 90
+    assert hot_inventory.reconcile(db) == {}
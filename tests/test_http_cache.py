@@ -0,0 +1,56 @@
+"""Conditional GETs and the shared response cache with a version store."""
+import pytest
+
+import cache
+import database
+import http_cache
+from conftest import make_product
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(cache.versions, "client", client)
+    monkeypatch.setattr(http_cache.responses, "client", client)
+    return client
+
+
+def cached_responses(redis_client):
+    return redis_client.keys("response:*")
+
+
+def test_unchanged_catalog_is_answered_with_304(client, flask_app, redis_client):
+    make_product(client, 1)
+    reader = flask_app.test_client()
+
+    response = reader.get("/products/?limit=10")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-cache"
+    etag = response.headers["ETag"]
+    assert len(cached_responses(redis_client)) == 1
+
+    assert reader.get("/products/?limit=10", headers={"If-None-Match": etag}).status_code == 304
+    make_product(client, 2)
+    response = reader.get("/products/?limit=10", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [product["id"] for product in response.get_json()] == [1, 2]
+
+
+def test_replica_reads_right_after_a_write_are_not_cached(client, flask_app, redis_client, replica_engine,
+                                                          monkeypatch):
+    make_product(client, 1, name="primary copy")
+    make_product(client, 2)
+    reader = flask_app.test_client()
+
+    # The replica has not seen product 2 yet, so its page must not be stored under the new version.
+    response = reader.get("/products/?limit=10")
+    assert [product["name"] for product in response.get_json()] == ["replica copy"]
+    assert "ETag" not in response.headers
+    assert cached_responses(redis_client) == []
+
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_WINDOW", 0)
+    response = reader.get("/products/?limit=5")
+    assert "ETag" in response.headers
+    assert len(cached_responses(redis_client)) == 1
@@ -0,0 +1,100 @@
+"""Idempotency-Key handling on order creation, with the in-process store and fakeredis."""
+import threading
+
+import pytest
+
+import idempotency
+import services
+from conftest import make_address, make_product
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, monkeypatch):
+    client = None
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        client = fakeredis.FakeStrictRedis()
+    store = idempotency.IdempotencyStore(client, ttl=60, lock_ttl=5, clock=Clock())
+    monkeypatch.setattr(idempotency, "store", store)
+    return store
+
+
+@pytest.fixture
+def catalog(client):
+    make_address(client, 1)
+    make_product(client, 1, inventory=100)
+
+
+def order(order_id, quantity=1):
+    return {"id": order_id, "address_id": 1, "productitems": [{"product_id": 1, "quantity": quantity}]}
+
+
+def post_order(client, body, key="key-1"):
+    return client.post("/orders/", json=body, headers={idempotency.IDEMPOTENCY_HEADER: key})
+
+
+def test_retry_replays_the_created_order(client, store, catalog):
+    first = post_order(client, order(1))
+    assert first.status_code == 201
+
+    retry = post_order(client, order(1))
+    assert retry.status_code == 201
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.get_json() == first.get_json()
+    assert client.get("/products/1/").get_json()["inventory"] == 99
+
+
+def test_same_key_with_another_body_is_rejected(client, store, catalog):
+    assert post_order(client, order(1)).status_code == 201
+    assert post_order(client, order(2)).status_code == 422
+    assert post_order(client, order(2), key="key-2").status_code == 201
+
+
+def test_retry_while_the_first_request_runs_gets_409(client, flask_app, store, catalog, monkeypatch):
+    claimed, finish = threading.Event(), threading.Event()
+    create_order = services.create_order
+
+    def slow_create_order(db, order_create):
+        claimed.set()
+        finish.wait(5)
+        return create_order(db, order_create)
+
+    monkeypatch.setattr(services, "create_order", slow_create_order)
+    responses = []
+    first = threading.Thread(target=lambda: responses.append(post_order(flask_app.test_client(), order(1))))
+    first.start()
+    assert claimed.wait(5)
+
+    assert post_order(client, order(1)).status_code == 409
+    finish.set()
+    first.join()
+    assert responses[0].status_code == 201
+    assert post_order(client, order(1)).headers["Idempotent-Replayed"] == "true"
+
+
+def test_keys_expire(client, store, catalog):
+    assert post_order(client, order(1)).status_code == 201
+    key = "idempotency:/orders/:key-1"
+    if store.client is not None:
+        assert 0 < store.client.ttl(key) <= store.ttl
+        store.client.delete(key)
+    else:
+        store.clock.now += store.ttl
+    assert post_order(client, order(2)).status_code == 201
+
+    # A claim left by a crashed request only blocks retries for lock_ttl seconds.
+    store.begin("idempotency:/orders/:key-2", "crashed request")
+    if store.client is not None:
+        assert 0 < store.client.ttl("idempotency:/orders/:key-2") <= store.lock_ttl
+        store.client.delete("idempotency:/orders/:key-2")
+    else:
+        store.clock.now += store.lock_ttl
+    assert post_order(client, order(3), key="key-2").status_code == 201
@@ -0,0 +1,90 @@
+"""Per-process LRU caches and the invalidation bus."""
+import local_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    lru = local_cache.LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+
+    assert lru.get("b") is local_cache.MISSING
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert lru.stats() == {"size": 2, "maxsize": 2, "ttl": local_cache.LOCAL_CACHE_TTL,
+                           "hits": 3, "misses": 1, "evictions": 1, "expirations": 0}
+
+
+def test_expired_entries_count_as_misses():
+    clock = Clock()
+    lru = local_cache.LRUCache(ttl=10, clock=clock)
+    lru.set("a", 1)
+    clock.now = 9.9
+    assert lru.get("a") == 1
+    clock.now = 10
+    assert lru.get("a", None) is None
+
+    stats = lru.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["expirations"]) == (0, 1, 1, 1)
+
+
+def test_get_or_load_caches_values_but_not_misses():
+    lru = local_cache.LRUCache()
+    calls = []
+
+    def load():
+        calls.append(1)
+        return {"id": 1}
+
+    assert lru.get_or_load("a", load) == {"id": 1}
+    assert lru.get_or_load("a", load) == {"id": 1}
+    assert len(calls) == 1
+    assert lru.get_or_load("b", lambda: None) is None
+    assert lru.get("b", None) is None
+
+
+def test_load_racing_an_invalidation_is_not_stored():
+    lru = local_cache.LRUCache()
+
+    def load_old():
+        # A write commits and invalidates while the old row is being loaded.
+        lru.invalidate("a")
+        return "old"
+
+    assert lru.get_or_load("a", load_old) == "old"
+    assert lru.get("a", None) is None
+    assert lru.get_or_load("a", lambda: "new") == "new"
+    assert lru.get("a") == "new"
+
+
+def test_invalidations_reach_every_subscriber():
+    bus = local_cache.LocalBus()
+    received = []
+
+    def broken(message):
+        raise ValueError("handler bug")
+
+    bus.subscribe(broken)
+    bus.subscribe(received.append)
+    bus.publish({"type": "invalidate", "cache": "product", "keys": [1]})
+    assert received == [{"type": "invalidate", "cache": "product", "keys": [1]}]
+
+
+def test_invalidate_drops_keys_or_the_whole_cache(flask_app):
+    local_cache.product_cache.set(1, "one")
+    local_cache.product_cache.set(2, "two")
+    local_cache.invalidate("product", 1)
+    assert local_cache.product_cache.get(1, None) is None
+    assert local_cache.product_cache.get(2) == "two"
+
+    local_cache.invalidate("product")
+    assert local_cache.product_cache.get(2, None) is None
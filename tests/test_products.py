@@ -0,0 +1,20 @@
+"""Product create and update through the REST endpoints."""
+from conftest import make_product
+
+
+def test_fractional_values_round_like_mysql_on_create_and_update(client):
+    product = make_product(client, 1, weight=1.5, price=2.4)
+    assert client.get("/products/1/").get_json()["weight"] == 2
+
+    response = client.put("/products/1/", json={**product, "weight": 2.5, "price": 0.5})
+    assert response.status_code == 200
+    assert (response.get_json()["weight"], response.get_json()["price"]) == (3, 1)
+    assert client.get("/products/1/").get_json()["price"] == 1
+
+
+def test_page_limit_must_be_positive(client):
+    make_product(client, 1)
+    make_product(client, 2)
+    assert client.get("/products/?limit=0").status_code == 400
+    assert client.get("/products/?limit=-1").status_code == 400
+    assert [product["id"] for product in client.get("/products/?limit=1").get_json()] == [1]
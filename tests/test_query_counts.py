@@ -0,0 +1,44 @@
+"""Order endpoints run a fixed number of SQL statements, whatever the result size."""
+import pytest
+
+from conftest import make_address, make_order, make_product
+
+
+def seed_orders(client, order_ids, items_per_order):
+    for product_id in range(1, items_per_order + 1):
+        if client.get(f"/products/{product_id}/").status_code == 404:
+            make_product(client, product_id)
+    for order_id in order_ids:
+        make_order(client, order_id, 1, [(product_id, 1) for product_id in range(1, items_per_order + 1)])
+
+
+def count(client, statements, url):
+    statements.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize("url", [
+    "/orders/1/",
+    "/orders/1/?compact=true",
+    "/orders/status/?status=pending",
+    "/orders/status/?status=pending&compact=true",
+    "/orders/?status=pending",
+])
+def test_statement_count_does_not_grow_with_results(client, statements, url):
+    make_address(client, 1)
+    seed_orders(client, [1], items_per_order=1)
+    small = count(client, statements, url)
+
+    seed_orders(client, range(2, 12), items_per_order=4)
+    large = count(client, statements, url)
+
+    assert small == large
+
+
+def test_order_detail_loads_items_and_address_in_two_statements(client, statements):
+    make_address(client, 1)
+    seed_orders(client, [1], items_per_order=3)
+    assert count(client, statements, "/orders/1/") == 2
+    assert count(client, statements, "/orders/1/?compact=true") == 1
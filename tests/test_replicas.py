@@ -0,0 +1,43 @@
+"""Read routing with two SQLite files standing in for the primary and a replica."""
+import os
+
+import database
+import models
+import services
+from conftest import DATA_DIR, make_product
+
+
+def test_read_only_calls_go_to_the_replica(client, db, replica_engine):
+    make_product(client, 1, name="primary copy")
+    assert services.get_products_by_ids(db, [1])[1]["name"] == "replica copy"
+    assert services.get_product_by_id(db, 1).name == "primary copy"
+
+
+def test_reads_after_a_write_stay_on_the_primary(client, db, replica_engine):
+    make_product(client, 1, name="primary copy")
+    db.add(models.Address(id=1, country="UA", city="Kyiv", street="Main"))
+    db.flush()
+    assert services.get_products_by_ids(db, [1])[1]["name"] == "primary copy"
+
+
+def test_client_reads_its_writes_for_a_while(client, flask_app, replica_engine, monkeypatch):
+    make_product(client, 1, name="primary copy")
+    assert client.get("/products/?ids=1").get_json()["results"][0]["name"] == "primary copy"
+
+    fresh = flask_app.test_client()
+    assert fresh.get("/products/?ids=1").get_json()["results"][0]["name"] == "replica copy"
+
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_WINDOW", 0)
+    fresh.post("/products/", json={"id": 2, "name": "other", "color": "red", "weight": 1, "price": 10,
+                                   "inventory": 1})
+    assert fresh.get("/products/?ids=1").get_json()["results"][0]["name"] == "replica copy"
+
+
+def test_failed_replica_is_taken_out(client, db, monkeypatch):
+    make_product(client, 1, name="primary copy")
+    engine = database.create_db_engine(f"sqlite:///{os.path.join(DATA_DIR, 'missing', 'replica.db')}")
+    monkeypatch.setattr(database, "replicas", database.ReplicaPool([engine], retry_interval=60))
+
+    assert services.get_products_by_ids(db, [1])[1]["name"] == "primary copy"
+    assert database.replicas.stats()[0]["healthy"] is False
+    assert database.replicas.choose() is None
@@ -0,0 +1,59 @@
+"""JSON-RPC batches run in one transaction that a failed call rolls back."""
+import pytest
+from flask import g
+
+import app as app_module
+import services
+from conftest import make_address, make_product
+
+
+def call(call_id, method, **params):
+    return {"jsonrpc": "2.0", "id": call_id, "method": method, "params": params}
+
+
+def test_failed_call_rolls_back_the_whole_batch(client, db):
+    make_address(client, 1)
+    make_product(client, 1, inventory=10)
+
+    results = client.post("/json-rpc", json=[
+        call(1, "addresses.create", address={"id": 2, "country": "UA", "city": "Kyiv", "street": "Main"}),
+        call(2, "products.get", id=1),
+        call(3, "orders.create", order={"id": 1, "address_id": 1,
+                                        "productitems": [{"product_id": 1, "quantity": 11}]}),
+        call(4, "addresses.delete", id=1),
+    ]).get_json()
+    by_id = {result["id"]: result for result in results}
+
+    # The create succeeded on its own, but is reported as rolled back with the batch.
+    assert by_id[1]["error"]["code"] == app_module.BatchAbortedError.code
+    assert by_id[1]["error"]["data"]["message"] == "The batch was rolled back"
+    assert by_id[2]["result"]["id"] == 1
+    assert by_id[3]["error"]["code"] == app_module.ConflictError.code
+    assert by_id[4]["error"]["data"]["message"] == "An earlier call in this batch failed"
+    assert services.get_address_by_id(db, 2) is None
+    assert services.get_address_by_id(db, 1) is not None
+
+
+def test_batch_is_rolled_back_when_a_later_hook_fails(client, db, flask_app, monkeypatch):
+    make_product(client, 1)
+    sessions = []
+
+    def failing_hook():
+        sessions.append(g.db)
+        raise RuntimeError("hook failed")
+
+    monkeypatch.setitem(flask_app.before_request_funcs, None,
+                        [*flask_app.before_request_funcs.get(None, []), failing_hook])
+    # Propagated errors skip the after_request hooks, and so end_rpc_batch.
+    monkeypatch.setitem(flask_app.config, "PROPAGATE_EXCEPTIONS", True)
+    with pytest.raises(RuntimeError):
+        client.post("/json-rpc", json=[call(1, "products.get", id=1)])
+
+    [session] = sessions
+    assert not session.info["batch"]
+    assert not session.in_transaction()
+    monkeypatch.undo()
+    assert client.post("/json-rpc", json=[
+        call(1, "products.update", id=1, product={"name": "renamed", "color": "red", "weight": 1, "price": 10,
+                                                  "inventory": 100}),
+    ]).get_json()[0]["result"]["name"] == "renamed"